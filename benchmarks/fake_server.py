@@ -0,0 +1,297 @@
+"""
+A local stand-in for the TSheets REST API, serving synthetic users, jobcodes, jobcode assignments, timesheets and
+payroll reports with the API's pagination (`page`, `per_page`, `more`) and `supplemental_data`, plus optional
+latency and throttling (429 with a Retry-After header).
+
+usage:
+    python benchmarks/fake_server.py --users 200 --jobcodes 400 --days 60 --latency 20 --rate 50
+
+The server prints its base url (i.e. http://127.0.0.1:53211/api/v1/) on the first line of its output.
+`GET <base url>_stats` returns the number of requests served and throttled, and `GET <base url>_reset` resets them.
+"""
+import argparse
+import datetime
+import json
+import random
+import sys
+import threading
+import time
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+
+class Dataset(object):
+    """
+    Synthetic company data, generated deterministically from its sizes
+    """
+
+    def __init__(self, users=50, jobcodes=100, days=30, timesheets_per_day=1, assignments_per_user=10, seed=1):
+        rnd = random.Random(seed)
+        self.start_date = datetime.date(2014, 1, 1)
+        modified = "2014-01-01T00:00:00+00:00"
+
+        self.users = {}
+        for i in range(1, users + 1):
+            self.users[i] = {
+                "id": i, "first_name": "First%d" % i, "last_name": "Last%d" % i, "group_id": i % 10,
+                "active": True, "employee_number": i, "salaried": False, "exempt": False,
+                "username": "user%d" % i, "email": "user%d@example.com" % i, "payroll_id": str(i),
+                "hire_date": "2010-01-01", "term_date": "0000-00-00", "last_modified": modified,
+                "last_active": modified, "created": modified, "approved_to": "2014-01-15",
+                "submitted_to": "2014-01-20", "permissions": {"admin": False, "mobile": True},
+            }
+
+        # a two levels tree: 1 parent for every 10 jobcodes
+        self.jobcodes = {}
+        for i in range(1, jobcodes + 1):
+            is_parent = i % 10 == 1
+            self.jobcodes[i] = {
+                "id": i, "parent_id": 0 if is_parent else i - ((i - 1) % 10), "name": "Jobcode %d" % i,
+                "short_code": "J%d" % i, "type": "regular", "active": True, "billable": False,
+                "billable_rate": 0.0, "has_children": is_parent and i < jobcodes, "assigned_to_all": i % 25 == 0,
+                "last_modified": modified, "created": modified, "required_customfields": [],
+                "filtered_customfielditems": "",
+            }
+        leaves = [j for j in self.jobcodes.values() if not j["has_children"]]
+
+        self.assignments = {}
+        user_jobcodes = {}
+        for user_id in self.users:
+            picked = rnd.sample(leaves, min(assignments_per_user, len(leaves)))
+            user_jobcodes[user_id] = [j["id"] for j in picked]
+            for jobcode in picked:
+                assignment_id = len(self.assignments) + 1
+                self.assignments[assignment_id] = {
+                    "id": assignment_id, "user_id": user_id, "jobcode_id": jobcode["id"], "active": True,
+                    "last_modified": modified, "created": modified,
+                }
+
+        self.timesheets = {}
+        for day in range(days):
+            date = self.start_date + datetime.timedelta(days=day)
+            for user_id in self.users:
+                for _ in range(timesheets_per_day):
+                    timesheet_id = len(self.timesheets) + 1
+                    start = datetime.datetime.combine(date, datetime.time(8 + rnd.randint(0, 4)))
+                    duration = rnd.randint(1800, 4 * 3600)
+                    end = start + datetime.timedelta(seconds=duration)
+                    self.timesheets[timesheet_id] = {
+                        "id": timesheet_id, "user_id": user_id, "jobcode_id": rnd.choice(user_jobcodes[user_id]),
+                        "start": start.strftime("%Y-%m-%dT%H:%M:%S-06:00"),
+                        "end": end.strftime("%Y-%m-%dT%H:%M:%S-06:00"), "duration": duration,
+                        "date": date.strftime("%Y-%m-%d"), "tz": -6, "tz_str": "tsMT", "type": "regular",
+                        "location": "(Eagle, ID?)", "on_the_clock": False, "locked": int(day < 15), "notes": "",
+                        "customfields": {"19142": "Item 1"}, "last_modified": modified, "created": modified,
+                        "attached_files": [], "created_by_user_id": user_id,
+                    }
+        self.timesheets_by_date = sorted(self.timesheets.values(), key=lambda ts: (ts["date"], ts["id"]))
+
+
+def _ids(params, key):
+    value = params.get(key)
+    if not value:
+        return None
+    return set(int(i) for i in value.split(","))
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    # the headers and the body are written separately: without this, delayed ACKs add ~40ms to every response
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+        endpoint = url.path.split("/api/v1/", 1)[-1]
+
+        if endpoint == "_stats":
+            return self._send(200, {"requests": server.requests, "throttled": server.throttled})
+        if endpoint == "_reset":
+            with server.lock:
+                server.requests = server.throttled = 0
+            return self._send(200, {"requests": 0, "throttled": 0})
+
+        with server.lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+        retry_after = server.throttle()
+        if retry_after:
+            with server.lock:
+                server.throttled += 1
+            return self._send(429, {"error": {"code": 429, "message": "Too Many Requests"}},
+                              {"Retry-After": "%.3f" % retry_after})
+
+        if endpoint == "reports/payroll":
+            return self._send(200, self._payroll(params))
+        query = self._query(endpoint, params)
+        if query is None:
+            return self._send(404, {"error": {"code": 404, "message": "Not Found"}})
+        key, rows = query
+
+        per_page = min(int(params.get("per_page", 50)), 50)
+        page = int(params.get("page", 1))
+        rows_page = rows[(page - 1) * per_page:page * per_page]
+        response = {
+            "results": {key: dict((str(row["id"]), row) for row in rows_page)},
+            "more": page * per_page < len(rows),
+            "supplemental_data": self._supplemental(key, rows_page),
+        }
+        return self._send(200, response)
+
+    def _query(self, endpoint, params):
+        """
+        returns the result key and the (cached) list of rows matching the query, regardless of its page
+        """
+        cache_key = (endpoint, tuple(sorted((k, v) for k, v in params.items() if k not in ("page", "per_page"))))
+        cached = self.server.queries.get(cache_key)
+        if cached is not None:
+            return cached
+
+        data = self.server.dataset
+        ids = _ids(params, "ids")
+        if endpoint == "current_user":
+            result = ("users", [data.users[1]])
+        elif endpoint == "users":
+            rows = [data.users[i] for i in sorted(data.users)]
+            result = ("users", [u for u in rows if ids is None or u["id"] in ids])
+        elif endpoint == "jobcodes":
+            parent_ids = _ids(params, "parent_ids")
+            rows = [data.jobcodes[i] for i in sorted(data.jobcodes)]
+            result = ("jobcodes", [j for j in rows if (ids is None or j["id"] in ids) and
+                                   (parent_ids is None or -1 in parent_ids or j["parent_id"] in parent_ids)])
+        elif endpoint == "jobcode_assignments":
+            user_ids = _ids(params, "user_ids")
+            rows = [data.assignments[i] for i in sorted(data.assignments)]
+            result = ("jobcode_assignments", [a for a in rows if user_ids is None or a["user_id"] in user_ids])
+        elif endpoint == "timesheets":
+            user_ids = _ids(params, "user_ids")
+            start_date = params.get("start_date", "0000-00-00")
+            end_date = params.get("end_date", "9999-99-99")
+            result = ("timesheets", [ts for ts in data.timesheets_by_date
+                                     if start_date <= ts["date"] <= end_date and
+                                     (ids is None or ts["id"] in ids) and
+                                     (user_ids is None or ts["user_id"] in user_ids)])
+        else:
+            return None
+        with self.server.lock:
+            self.server.queries[cache_key] = result
+        return result
+
+    def _supplemental(self, key, rows):
+        data = self.server.dataset
+        if key not in ("timesheets", "jobcode_assignments"):
+            return {}
+        users = {}
+        jobcodes = {}
+        for row in rows:
+            users[str(row["user_id"])] = data.users[row["user_id"]]
+            jobcode = data.jobcodes[row["jobcode_id"]]
+            jobcodes[str(jobcode["id"])] = jobcode
+            # like the API, include the parents needed to trace a jobcode back to the top level
+            while jobcode["parent_id"]:
+                jobcode = data.jobcodes[jobcode["parent_id"]]
+                jobcodes[str(jobcode["id"])] = jobcode
+        return {"users": users, "jobcodes": jobcodes}
+
+    def _payroll(self, params):
+        data = self.server.dataset
+        user_ids = _ids(params, "user_ids") or set(data.users)
+        start_date = params["start_date"]
+        end_date = params["end_date"]
+        totals = dict((user_id, 0) for user_id in user_ids)
+        for ts in data.timesheets_by_date:
+            if start_date <= ts["date"] <= end_date and ts["user_id"] in totals:
+                totals[ts["user_id"]] += ts["duration"]
+        report = {}
+        for user_id, seconds in totals.items():
+            report[str(user_id)] = {
+                "user_id": user_id, "client_id": 0, "start_date": start_date, "end_date": end_date,
+                "total_re_seconds": seconds, "total_ot_seconds": 0, "total_dt_seconds": 0,
+                "total_pto_seconds": 0, "total_work_seconds": seconds, "pto_seconds": {},
+            }
+        return {"results": {"payroll_report": report}, "more": False}
+
+    def _send(self, status, body, headers=None):
+        content = json.dumps(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class FakeTSheetsServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    args:
+        dataset (Dataset) : the data served
+        latency (float)   : seconds added to every request
+        rate (float)      : requests per second allowed before answering 429. None disables throttling.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, dataset, latency=0.0, rate=None, host="127.0.0.1", port=0):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), Handler)
+        self.dataset = dataset
+        self.latency = latency
+        self.rate = rate
+        self.requests = 0
+        self.throttled = 0
+        self.queries = {}
+        self.lock = threading.Lock()
+        self._allowance = rate
+        self._checked = time.time()
+
+    @property
+    def base_url(self):
+        return "http://{}:{}/api/v1/".format(*self.server_address)
+
+    def throttle(self):
+        """
+        returns 0 when the request is allowed, or the number of seconds to wait before retrying
+        """
+        if not self.rate:
+            return 0
+        with self.lock:
+            now = time.time()
+            self._allowance = min(self.rate, self._allowance + (now - self._checked) * self.rate)
+            self._checked = now
+            if self._allowance < 1.0:
+                return (1.0 - self._allowance) / self.rate
+            self._allowance -= 1.0
+            return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--jobcodes", type=int, default=100)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--timesheets-per-day", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0, help="latency per request, in milliseconds")
+    parser.add_argument("--rate", type=float, default=None, help="requests per second before throttling")
+    parser.add_argument("--port", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    dataset = Dataset(users=args.users, jobcodes=args.jobcodes, days=args.days,
+                      timesheets_per_day=args.timesheets_per_day)
+    server = FakeTSheetsServer(dataset, latency=args.latency / 1000.0, rate=args.rate, port=args.port)
+    sys.stdout.write(server.base_url + "\n")
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+Offline benchmarks of the client against a local stand-in for the TSheets API (see fake_server.py).
+
+Each benchmark case runs in its own Python process, so that its peak memory and CPU time are its own, and
+reports:
+    wall_seconds, cpu_seconds : elapsed and CPU (user + system) time of the case
+    requests, throttled       : requests received by the server, and how many of them were answered 429
+    pages_per_sec             : successful requests per second
+    rows                      : number of records returned by the case
+    rows_per_sec              : records per second
+    error                     : the exception which interrupted the case, if any
+    peak_rss_kb, base_rss_kb  : peak resident memory of the process, and its resident memory before the case
+
+usage:
+    python benchmarks/run.py --sizes small medium --latency 20 --output report.json
+
+The report is a JSON document meant to be compared between commits.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from fake_server import Dataset  # noqa: E402
+from tsheets.api import API  # noqa: E402
+try:
+    from tsheets.decoder import preference  # noqa: E402
+except ImportError:
+    # commits before the pluggable JSON decoders, so that they can be compared
+    preference = ["json"]
+from tsheets.models import Timesheet, LazyRecord  # noqa: E402
+from tsheets.scheduler import RequestScheduler  # noqa: E402
+
+SIZES = {
+    "small": {"users": 50, "jobcodes": 100, "days": 30},
+    "medium": {"users": 200, "jobcodes": 400, "days": 60},
+    "large": {"users": 1000, "jobcodes": 1000, "days": 90},
+}
+
+START_DATE = datetime.date(2014, 1, 1)
+
+
+def _params(size):
+    """
+    returns the filters of the cases: every date and every user of the dataset
+    """
+    end_date = START_DATE + datetime.timedelta(days=SIZES[size]["days"] - 1)
+    user_ids = ",".join(str(i) for i in range(1, SIZES[size]["users"] + 1))
+    return {"start_date": START_DATE.strftime("%Y-%m-%d"), "end_date": end_date.strftime("%Y-%m-%d"),
+            "user_ids": user_ids}
+
+
+def case_list_timesheets(api, params):
+    return len(api.list_timesheets(start_date=params["start_date"], end_date=params["end_date"]))
+
+
+def case_list_timesheets_prefetch(api, params):
+    return len(api.list_timesheets(start_date=params["start_date"], end_date=params["end_date"], prefetch=4))
+
+
+def case_list_timesheets_lazy(api, params):
+    return len(api.list_timesheets(start_date=params["start_date"], end_date=params["end_date"], lazy=True))
+
+
+def case_list_jobcodes_by_user(api, params):
+    result = api.list_jobcodes_by_user(params["user_ids"], exclude_global=False)
+    return sum(len(entry["jobcodes"]) for entry in result.itervalues())
+
+
+def case_grouped_timesheets(api, params):
+    result = api.grouped_timesheets(params["user_ids"], params["start_date"], params["end_date"])
+    return sum(len(jobcode["timesheets"]) for key, user in result.iteritems() if key != "summary"
+               for jobcode in user["jobcodes"].itervalues())
+
+
+def case_get_payroll_report(api, params):
+    return len(api.get_payroll_report(start_date=params["start_date"], end_date=params["end_date"]))
+
+
+def case_model_construction(api, params, rows):
+    return len([Timesheet(api=api, **row) for row in rows])
+
+
+def _bodies(rows):
+    """
+    returns the raw bodies of the timesheets pages holding `rows`
+    """
+    return [json.dumps({"results": {"timesheets": dict((str(row["id"]), row) for row in rows[i:i + 50])},
+                        "more": True})
+            for i in range(0, len(rows), 50)]
+
+
+def case_decode(api, params, bodies):
+    # decodes raw response bodies with the client's JSON decoder
+    decode = getattr(api, "_decode", None) or json.loads
+    return sum(len(decode(body)["results"]["timesheets"]) for body in bodies)
+
+
+def case_lazy_construction(api, params, rows):
+    # builds the records and reads the fields most reports use
+    records = [LazyRecord(Timesheet, row, api=api) for row in rows]
+    for record in records:
+        record.duration, record.user_id, record.date
+    return len(records)
+
+
+# cases which need the server
+HTTP_CASES = ["list_timesheets", "list_timesheets_prefetch", "list_timesheets_lazy", "list_jobcodes_by_user",
+              "grouped_timesheets", "get_payroll_report"]
+# cases building models from raw rows, without any request
+LOCAL_CASES = ["model_construction", "lazy_construction", "decode"]
+CASES = HTTP_CASES + LOCAL_CASES
+
+
+def _rss_kb():
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss // 1024 if sys.platform == "darwin" else maxrss
+
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_case(name, size, url, client_rate, decoder=None):
+    """
+    runs a single case in the current process and returns its measurements
+    """
+    params = _params(size)
+    kwargs = {"json_decoder": decoder} if decoder else {}
+    api = API("benchmark", max_workers=4,
+              scheduler=RequestScheduler(rate=client_rate, burst=max(int(client_rate or 0), 10)), **kwargs)
+    api._base_url = url
+    rows = None
+    if name in LOCAL_CASES:
+        dataset = Dataset(**SIZES[size])
+        rows = dataset.timesheets_by_date
+        del dataset
+        if name == "decode":
+            rows = _bodies(rows)
+    else:
+        requests.get(url + "_reset").raise_for_status()
+
+    base_rss = _rss_kb()
+    cpu = _cpu_seconds()
+    started = time.time()
+    error = None
+    try:
+        if rows is None:
+            count = globals()["case_" + name](api, params)
+        else:
+            count = globals()["case_" + name](api, params, rows)
+    except Exception as e:
+        # i.e. a request still throttled after the last retry: reported, so that the other cases still run
+        count = 0
+        error = "{}: {}".format(type(e).__name__, e)
+    wall = time.time() - started
+    cpu = _cpu_seconds() - cpu
+    api.close()
+
+    stats = {"requests": 0, "throttled": 0}
+    if name in HTTP_CASES:
+        stats = requests.get(url + "_stats").json()
+    pages = stats["requests"] - stats["throttled"]
+    return {
+        "case": name,
+        "size": size,
+        "wall_seconds": round(wall, 4),
+        "cpu_seconds": round(cpu, 4),
+        "requests": stats["requests"],
+        "throttled": stats["throttled"],
+        "pages_per_sec": round(pages / wall, 2) if wall else None,
+        "rows": count,
+        "rows_per_sec": round(count / wall, 2) if wall else None,
+        "peak_rss_kb": _rss_kb(),
+        "base_rss_kb": base_rss,
+        "error": error,
+    }
+
+
+def _start_server(size, latency, rate):
+    command = [sys.executable, os.path.join(HERE, "fake_server.py"), "--latency", str(latency)]
+    for key, value in sorted(SIZES[size].items()):
+        command += ["--" + key, str(value)]
+    if rate:
+        command += ["--rate", str(rate)]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE)
+    url = server.stdout.readline().strip()
+    if not url:
+        server.wait()
+        raise RuntimeError("the benchmark server did not start")
+    return server, url
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=HERE,
+                                       stderr=open(os.devnull, "w")).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", choices=sorted(SIZES), default=["small", "medium"])
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES)
+    parser.add_argument("--latency", type=float, default=0.0, help="server latency per request, in milliseconds")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="requests per second the server accepts before answering 429. Default is no limit.")
+    parser.add_argument("--client-rate", type=float, default=None,
+                        help="requests per second of the client's scheduler. Default is no limit.")
+    parser.add_argument("--decoder", choices=["ujson", "simplejson", "json"], default=None,
+                        help="JSON library of the client. Default is the fastest one installed.")
+    parser.add_argument("--output", default="benchmark.json", help="path of the JSON report")
+    # internal: runs a single case and prints its measurements
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--size", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        result = run_case(args.run_case, args.size, args.url, args.client_rate, args.decoder)
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+        # skips the interpreter shutdown, which would race the pool threads still waiting on a retry
+        os._exit(0)
+
+    results = []
+    for size in args.sizes:
+        server, url = _start_server(size, args.latency, args.rate)
+        try:
+            for name in args.cases:
+                command = [sys.executable, os.path.abspath(__file__), "--run-case", name, "--size", size,
+                           "--url", url]
+                if args.client_rate:
+                    command += ["--client-rate", str(args.client_rate)]
+                if args.decoder:
+                    command += ["--decoder", args.decoder]
+                result = json.loads(subprocess.check_output(command).splitlines()[-1])
+                results.append(result)
+                sys.stderr.write("{size:<7} {case:<26} {wall_seconds:>9.3f}s {rows:>8} rows "
+                                 "{rows_per_sec:>11} rows/s {peak_rss_kb:>8} kB {throttled:>5} throttled "
+                                 "{error}\n".format(**result).replace(" None\n", "\n"))
+        finally:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"latency_ms": args.latency, "server_rate": args.rate, "client_rate": args.client_rate,
+                     "decoder": args.decoder or preference[0],
+                     "sizes": dict((size, SIZES[size]) for size in args.sizes)},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    sys.stderr.write("report written to {}\n".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -14,4 +14,7 @@ setup(
     install_requires=[
         "requests",
     ],
+    extras_require={
+        "frame": ["numpy"],
+    },
 )
@@ -1,3 +1,9 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
 import requests
 from httplib import HTTPException
 from .models import (User,
@@ -5,8 +11,21 @@ from .models import (User,
                      Timesheet,
                      Jobcode,
                      JobcodeAssignment,
-                     PayrollReport)
+                     PayrollReport,
+                     LazyRecord,
+                     TSObjectList)
 from .error import TSheetsError
+from .identity import IdentityMap
+from .batch import batches, WriteResult, BatchResult
+from .export import Exporter
+from .planner import TimesheetQueryPlanner
+from .frame import TimesheetFrame
+from .tree import JobcodeTree
+from .scheduler import RequestScheduler
+from .instrument import Instrumentation, Profile, RequestEvent
+from .cache import ResponseCache
+from .singleflight import SingleFlight
+from .decoder import get_decoder
 
 
 class API(object):
@@ -17,71 +36,426 @@ class API(object):
     _base_url = "https://rest.tsheets.com/api/v1/"
     _auth_header = None
     _session = None
+    _max_workers = 4
+    _prefetch = 0
+    _timeout = 60
+    _pool = None
+    _current_user = None
+    _jobcode_tree = None
+    store = None
+    cache = None
+    identity_map = None
+    instrumentation = None
+    _single_flight = None
+    archive = None
+    _decode = None
+    _http_adapter = None
+    # maximum number of records written by a single request
+    _max_batch_size = 50
+    # maximum length of the comma separated list of ids sent in a single request
+    _max_ids_length = 1500
+    # models of the supplemental data records which are shared through the identity map
+    _supplemental_models = {"users": User, "jobcodes": Jobcode}
     __auth_token = None
     __auth_key = None
     __auth_secret = None
 
-    def __init__(self, auth_token):
+    def __init__(self, auth_token, max_workers=4, prefetch=0, store=None, cache=None, scheduler=None,
+                 identity_map=None, instrumentation=None, coalesce=True, archive=None,
+                 json_decoder=None, http_adapter=None, timeout=60):
         """
         TODO: modify initializer to accept KEY and SECRET as parameters
+
+        args:
+            auth_token (str)  : the access token
+            max_workers (int) : size of the thread pool used for concurrent page fetches. Keep it small enough
+                                   to stay under the TSheets rate limits.
+            prefetch (int)    : default number of pages fetched ahead concurrently by the list methods.
+                                   0 (default) fetches pages one by one.
+            store (SyncStore) : optional local store used to answer `grouped_timesheets` and `User.timesheets`
+                                   after a delta sync (see `store.SyncStore`)
+            cache (ResponseCache) : optional cache of decoded responses, shared by every GET of this client
+                                       (see `cache.ResponseCache`)
+            scheduler (RequestScheduler) : rate limiter and retry policy shared by every request of this client.
+                                              Default is a `scheduler.RequestScheduler` with default settings.
+            identity_map (IdentityMap) : map of the shared User and Jobcode instances built from supplemental data.
+                                            Default is a new `identity.IdentityMap` for this client, keeping up
+                                            to 10000 instances.
+            instrumentation (Instrumentation) : optional listeners of the requests of this client (see
+                                                   `instrument.Instrumentation`). None (default) disables
+                                                   instrumentation.
+            coalesce (bool)   : when True (default), identical GETs issued concurrently by several threads (same
+                                   endpoint and normalized parameters) are sent once, every caller sharing the
+                                   decoded response, which must not be modified.
+            archive (TimesheetArchive) : optional permanent store of approved timesheets and payroll reports,
+                                            used by the timesheets and payroll queries for given users and dates
+                                            (see `archive.TimesheetArchive`)
+            json_decoder (str/callable) : the JSON library decoding the responses ('ujson', 'simplejson' or
+                                             'json'), or a callable taking the raw body of a response. Default
+                                             is the fastest library installed (see `decoder.get_decoder`).
+            http_adapter (HTTPAdapter) : optional `requests` adapter (connection pool) mounted on the session of
+                                            this client, to share connections between clients. It is left open
+                                            by `close`.
+            timeout (float/tuple) : seconds to wait for TSheets to accept the connection and to send data, or a
+                                       (connect, read) pair, before a request times out. A timed out GET, PUT
+                                       or DELETE is retried by the scheduler. Default is 60 seconds.
         """
         self.__auth_token = auth_token
-        url = self._base_url + "users"
+        self._max_workers = max_workers
+        self._prefetch = prefetch
+        self._timeout = timeout
+        self.store = store
+        self.cache = cache
+        self._scheduler = scheduler or RequestScheduler()
+        self.identity_map = identity_map if identity_map is not None else IdentityMap()
+        self.instrumentation = instrumentation
+        self._single_flight = SingleFlight() if coalesce else None
+        self.archive = archive
+        self._decode = get_decoder(json_decoder)
+        self._pool_lock = threading.Lock()
+        self._current_user = None
         self._auth_header = {'Authorization': "Bearer {}".format(auth_token)}
         self._session = requests.Session()
         self._session.headers.update(self._auth_header)
-        response = self._session.get(url)
+        self._http_adapter = http_adapter
+        if http_adapter is not None:
+            self._session.mount("https://", http_adapter)
+            self._session.mount("http://", http_adapter)
 
-        if response.status_code != 200:
-            raise TSheetsError(response.status_code, response.content)
-        else:
-            return None
+    def validate(self):
+        """
+        validates the access token by fetching the user associated with it, which is cached for
+        `get_current_user`. Construction does not touch the network: without a call to this method, an invalid
+        token raises a TSheetsError on the first request.
+
+        returns:
+            CurrentUser
+
+        raises:
+            TSheetsError
+            HTTPException
+        """
+        self._current_user = self.__get_TSObjects(CurrentUser)[0]
+        return self._current_user
+
+    def _get_pool(self):
+        """
+        returns the thread pool shared by every concurrent fetch of this client, creating it on first use
+        """
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self._max_workers)
+            return self._pool
+
+    def close(self):
+        """
+        shuts down the thread pool and closes the HTTP session of this client
+        """
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool = None
+        if self._http_adapter is not None:
+            # the shared connection pool outlives this client
+            self._session.adapters.clear()
+        self._session.close()
+
+    def _fetch_page(self, model, params, event=None):
+        """
+        performs a single GET request against the endpoint of `model`, unless its response is in the cache
+
+        args:
+            model (class) : the TSheetsObject class which provides API endpoint information
+            params (dict) : the query string parameters of the request
+            event (RequestEvent) : filled in with the measurements of the request when the client is
+                                      instrumented. When given, the caller emits it, unless the request fails.
+                                      Otherwise the event is emitted here.
+
+        returns:
+            JSON response (dict) : the decoded response of the API
+
+        raises:
+            TSheetsError
+            HTTPException
+        """
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return self.__request_page(model, params, event)
+
+        emit = event is None
+        if emit:
+            event = RequestEvent(model._endpoint_name, params)
+        try:
+            page_json = self.__request_page(model, params, event)
+        except Exception as error:
+            event.error = "{}: {}".format(type(error).__name__, error)
+            instrumentation.emit(event)
+            raise
+        if emit:
+            instrumentation.emit(event)
+        return page_json
+
+    def __request_page(self, model, params, event):
+        """
+        see: `API._fetch_page`
+        """
+        if self.cache is not None:
+            cached = self.cache.get(model._endpoint_name, params)
+            if cached is not None:
+                if event is not None:
+                    event.cache_hit = True
+                return cached
+
+        if self._single_flight is None:
+            return self.__get_page(model, params, event)
+        if event is not None:
+            started = time.time()
+        key = ResponseCache.key(model._endpoint_name, params)
+        page_json, shared = self._single_flight.do(key, self.__get_page, model, params, event)
+        if shared and event is not None:
+            event.coalesced = True
+            event.latency = time.time() - started
+        return page_json
+
+    def __get_page(self, model, params, event):
+        """
+        sends the GET request of `API.__request_page`
+        """
+        url = self._base_url + model._endpoint_name
+        try:
+            if event is not None:
+                started = time.time()
+            response = self._scheduler.request(self._session.get, url, params=params, timeout=self._timeout)
+            if event is not None:
+                event.latency = time.time() - started
+                event.retries = self._scheduler.last_retries()
+                event.status = response.status_code
+                event.bytes = len(response.content)
+            if response.status_code == 200:
+                if event is not None:
+                    started = time.time()
+                # decoded straight from the raw body, without the text decoding step of `response.json()`
+                page_json = self._decode(response.content)
+                if event is not None:
+                    event.decode_time = time.time() - started
+                if self.cache is not None:
+                    self.cache.set(model._endpoint_name, params, page_json)
+                return page_json
+            else:
+                raise TSheetsError(response.status_code, response.content)
+        except HTTPException as error:
+            raise error
+
+    def _iter_pages(self, model, **kwargs):
+        """
+        returns an iterator over the JSON responses (dicts) of every page of results for `model`. Queries the
+        client's archive can take part in are answered through it (see `archive.TimesheetArchive`); the others
+        are sent to TSheets.
+
+        see: `API._iter_api_pages`
+        """
+        if self.archive is not None and self.archive.answers(model, kwargs):
+            return self.archive.pages(self, model, **kwargs)
+        return self._iter_api_pages(model, **kwargs)
+
+    def _iter_api_pages(self, model, **kwargs):
+        """
+        generator which follows the `more` flag of the API and yields the JSON response (dict) of every page
+        of results for `model`, starting at `page` (default is 1), in page order.
+
+        When `prefetch` is greater than 0, the first page is fetched alone and, if it reports more results,
+        up to `prefetch` of the following pages are kept in flight concurrently in the client's thread pool.
+        Otherwise, only one page is held in memory at a time.
+
+        args:
+            model (class) : the TSheetsObject class which provides API endpoint information
+            kwargs: all keyword arguments appropriate for the endpoint, plus
+                prefetch (int) : number of pages to fetch ahead. Defaults to the client's `prefetch` setting.
+
+        raises:
+            TSheetsError
+            HTTPException
+        """
+        payload = {}
+        payload.update(**kwargs)
+        page = int(payload.pop('page', 1))
+        prefetch = int(payload.pop('prefetch', self._prefetch) or 0)
+
+        instrumentation = self.instrumentation
+        pages = self.__walk_pages(model, payload, page, prefetch, instrumentation is not None)
+        if instrumentation is None:
+            for page_json, _ in pages:
+                yield page_json
+            return
+
+        # the time the caller spends on a page, until it asks for the next one, is its hydration time
+        for page_json, event in pages:
+            started = time.time()
+            try:
+                yield page_json
+            finally:
+                event.hydration_time = time.time() - started
+                instrumentation.emit(event)
+
+    def __walk_pages(self, model, payload, page, prefetch, instrumented):
+        """
+        generator which yields the JSON response of every page and its RequestEvent (None when `instrumented`
+        is False).
+
+        see: `API._iter_api_pages`
+        """
+        while True:
+            payload['page'] = page
+            event = RequestEvent(model._endpoint_name, payload) if instrumented else None
+            page_json = self._fetch_page(model, payload, event)
+            yield page_json, event
+            if not page_json.get('more'):
+                return
+            page += 1
+            if prefetch > 0:
+                break
+
+        for page_json, event in self.__prefetch_pages(model, payload, page, prefetch, instrumented):
+            yield page_json, event
+
+    def __prefetch_pages(self, model, payload, page, prefetch, instrumented):
+        """
+        generator which keeps pages `page`..`page + prefetch - 1` in flight in the thread pool and yields
+        their JSON responses (with their RequestEvent) in page order, until a page reports no more results.
+        """
+        pool = self._get_pool()
+        pending = deque()
+        next_page = page
+
+        while True:
+            while len(pending) < prefetch:
+                params = dict(payload, page=next_page)
+                event = RequestEvent(model._endpoint_name, params) if instrumented else None
+                pending.append((pool.apply_async(self._fetch_page, (model, params, event)), event))
+                next_page += 1
+            async_result, event = pending.popleft()
+            page_json = async_result.get()
+            yield page_json, event
+            if not page_json.get('more'):
+                return
+
+    @staticmethod
+    def _result_rows(model, page_json):
+        """
+        returns the raw result rows (dicts) of `model` contained in the JSON response of a single page
+        """
+        tsobject_results = page_json.get('results', {}).get(model._result_object_key, [])
+        return tsobject_results.itervalues() if hasattr(tsobject_results, 'itervalues') else tsobject_results
+
+    def __hydrator(self, model, lazy=False):
+        """
+        returns the callable which turns a raw result row into an instance of `model`, or into a LazyRecord
+        over the row when `lazy` is True
+        """
+        if lazy:
+            return lambda tsobject: LazyRecord(model, tsobject, api=self)
+        return lambda tsobject: model(api=self, **tsobject)
+
+    def __iter_TSObjects(self, model, **kwargs):
+        """
+        generator which yields instances of `model` page by page, following the `more` flag of the API.
+
+        see: `API.__get_TSObjects`
+        """
+        hydrate = self.__hydrator(model, kwargs.pop('lazy', False))
+        for page_json in self._iter_pages(model, **kwargs):
+            for tsobject in self._result_rows(model, page_json):
+                yield hydrate(tsobject)
 
     def __get_TSObjects(self, model, **kwargs):
         """
         the private method which fetches data from TSheets
-        
+
+        When `page` is not in kwargs, all pages of results are fetched; otherwise only the requested page is.
+
         args:
             model (class) : the TSheetsObject class which provides API endpoint information
             kwargs: all keyword arguments appropriate for the endpoint
-            
+
         returns:
             JSON response (dict) : when `return_json` in kwargs is True, method will return the raw dict response
                                       from the API
             List of TSheetsObject (model) : when `return_json` is not present in kwargs, method will return a list of
-                                      objects of <model> type
-        
+                                      objects of <model> type (a TSObjectList, which also carries the
+                                      `supplemental_data` of the responses)
+            List of LazyRecord : when `lazy` in kwargs is True, method will return a list of views over the raw
+                                      results, which convert fields on access (see `models.LazyRecord`)
+
         raises:
             TSheetsError
             HTTPException
         """
-        # TODO: modify this method so it can handle POST requests (for API's insert/create operations)
-        #       or create a separated method.  haven't decided yet. :p
-
-        url = self._base_url + model._endpoint_name
         payload = {}
-        result = []
-
         payload.update(**kwargs)
 
         return_json = payload.get('return_json', False)
         payload.pop('return_json', None)
 
+        if return_json or 'page' in payload:
+            payload.pop('prefetch', None)
+        if return_json:
+            payload.pop('lazy', None)
+            return self._fetch_page(model, payload)
+
+        hydrate = self.__hydrator(model, payload.pop('lazy', False))
+        if 'page' in payload:
+            pages = [self._fetch_page(model, payload)]
+        else:
+            pages = self._iter_pages(model, **payload)
+
+        result = TSObjectList()
+        for page_json in pages:
+            result.extend(hydrate(tsobject) for tsobject in self._result_rows(model, page_json))
+            result._add_supplemental_data(page_json.get('supplemental_data'), self.__hydrate_supplemental)
+        return result
+
+    def _hydrate(self, model, tsobject):
+        """
+        returns the instance of `model` shared through the identity map for the raw `tsobject`
+        """
+        return self.identity_map.hydrate(model, tsobject, api=self)
+
+    def __hydrate_supplemental(self, key, record):
+        """
+        returns the object of a raw supplemental data record: the shared instance of its model for users and
+        jobcodes, the record itself otherwise
+        """
+        model = self._supplemental_models.get(key)
+        return self._hydrate(model, record) if model else record
+
+    @contextmanager
+    def profile(self):
+        """
+        context manager which records the requests made by this client during a block and reports where its time
+        went (network, JSON decoding, hydration, other). Instrumentation is enabled for the duration of the block
+        if it is not already. Requests made concurrently from other threads with this client are included.
+
+        usage:
+            with tsclient.profile() as profile:
+                tsclient.grouped_timesheets(user_ids, "2014-01-01", "2014-01-31")
+            print profile.report()
+
+        see: `instrument.Profile`
+        """
+        instrumentation = self.instrumentation
+        enabled = instrumentation is None
+        if enabled:
+            instrumentation = self.instrumentation = Instrumentation()
+        profile = Profile()
+        instrumentation.add_listener(profile)
+        profile.start()
         try:
-            response = self._session.get(url, params=payload)
-            if response.status_code == 200:
-                if return_json: return response.json()
-                tsobject_results = response.json()['results'][model._result_object_key]
-                # TODO: add code to handle supplemental data and more
-                tsobjects = tsobject_results.values() if hasattr(tsobject_results, 'values') else tsobject_results
-                for tsobject in tsobjects:
-                    model_instance = model(api=self, **tsobject)
-                    result.append(model_instance)
-                return result
-            else:
-                raise TSheetsError(response.status_code, response.content)
-        except HTTPException as error:
-            raise error
+            yield profile
+        finally:
+            profile.stop()
+            instrumentation.remove_listener(profile)
+            if enabled:
+                self.instrumentation = None
 
     def get_json(self, model, **kwargs):
         """
@@ -93,8 +467,9 @@ class API(object):
         """
         returns a User object associated with the current access token.
         """
-        user_list = self.__get_TSObjects(CurrentUser)
-        return user_list[0]
+        if self._current_user is None:
+            return self.validate()
+        return self._current_user
 
     def list_users(self, **kwargs):
         """
@@ -115,6 +490,11 @@ class API(object):
             per_page (int)        : Represents how many results you'd like to retrieve per request (page).
                                        Default is 50. Max is 50.
             page (int)            : Represents the page of results you'd like to retrieve.
+                                       If omitted, all pages are retrieved.
+            prefetch (int)        : Number of pages fetched ahead concurrently when retrieving all pages.
+                                       Defaults to the client's `prefetch` setting.
+            lazy (bool)           : If True, returns views over the raw results which convert
+                                       fields on access instead of fully built objects (see `models.LazyRecord`).
         
         see: http://developers.tsheets.com/docs/api/users/list-users
         """
@@ -146,6 +526,11 @@ class API(object):
             per_page (int) : Represents how many results you'd like to retrieve per request (page).
                                 Default is 50. Max is 50.
             page (int)     : Represents the page of results you'd like to retrieve.
+                                If omitted, all pages are retrieved.
+            prefetch (int) : Number of pages fetched ahead concurrently when retrieving all pages.
+                                Defaults to the client's `prefetch` setting.
+            lazy (bool)    : If True, returns views over the raw results which convert
+                                fields on access instead of fully built objects (see `models.LazyRecord`).
 
             modified_before (str) : (ISO8601 format). Only jobcodes modified before this date/time will be returned
                                        (i.e. 2004-02-12T15:19:21+00:00).
@@ -185,6 +570,11 @@ class API(object):
             per_page (int)        : Represents how many results you'd like to retrieve per request (page).
                                        Default is 50. Max is 50.
             page (int)            : Represents the page of results you'd like to retrieve.
+                                       If omitted, all pages are retrieved.
+            prefetch (int)        : Number of pages fetched ahead concurrently when retrieving all pages.
+                                       Defaults to the client's `prefetch` setting.
+            lazy (bool)           : If True, returns views over the raw results which convert
+                                       fields on access instead of fully built objects (see `models.LazyRecord`).
         
         see: http://developers.tsheets.com/docs/api/jobcode_assignments/list-jobcode-assignments
         """
@@ -225,12 +615,377 @@ class API(object):
                                         returned (i.e. 2004-02-12T15:19:21+00:00).
             per_page (int)  : optional. Represents how many results you'd like to retrieve per request (page).
                                  Default is 50. Max is 50.
-            page (int)      : optional. Represents the page of results you'd like to retrieve. Default is 1.
+            page (int)      : optional. Represents the page of results you'd like to retrieve.
+                                 If omitted, all pages are retrieved.
+            prefetch (int)  : optional. Number of pages fetched ahead concurrently when retrieving all pages.
+                                 Defaults to the client's `prefetch` setting.
+            lazy (bool)     : optional. If True, returns views over the raw results which convert
+                                 fields on access instead of fully built objects (see `models.LazyRecord`).
             
         see: http://developers.tsheets.com/docs/api/timesheets/list-timesheets
         """
         return self.__get_TSObjects(Timesheet, **kwargs)
 
+    def list_timesheets_sharded(self, start_date, end_date, shard_days=7, id_chunk_size=None, **kwargs):
+        """
+        Retrieves all timesheets from `start_date` to `end_date` by splitting the query into date windows
+        (and, when `id_chunk_size` is set, chunks of `user_ids`/`group_ids`) which are fetched in parallel in the
+        client's thread pool. Window sizes adapt to the number of pages each window returns, and timesheets
+        are deduplicated by id.
+
+        args:
+            start_date (str)    : YYYY-MM-DD formatted date
+            end_date (str)      : YYYY-MM-DD formatted date
+            shard_days (int)    : initial size, in days, of a date window
+            id_chunk_size (int) : maximum number of user/group ids per shard
+            kwargs: see `API.list_timesheets` method
+
+        see: `planner.TimesheetQueryPlanner`
+        """
+        planner = TimesheetQueryPlanner(self, shard_days=shard_days, id_chunk_size=id_chunk_size)
+        return planner.run(start_date, end_date, **kwargs)
+
+    def timesheet_frame(self, **kwargs):
+        """
+        Retrieves all timesheets matching the filters into a columnar TimesheetFrame (requires numpy),
+        converting each page to arrays as it arrives.
+
+        args:
+            kwargs: see `API.list_timesheets` method
+
+        see: `frame.TimesheetFrame`
+        """
+        return TimesheetFrame.from_pages(self._iter_pages(Timesheet, **kwargs))
+
+    def jobcode_tree(self, refresh=True, strategy='flat'):
+        """
+        returns the JobcodeTree of the company, loading it on first use. Later calls return the same tree,
+        refreshed with the jobcodes modified since the previous call unless `refresh` is False.
+
+        args:
+            refresh (bool) : if True, pulls the jobcodes modified since the tree was last loaded or refreshed
+            strategy (str) : 'flat' or 'bfs', see `tree.JobcodeTree.load`
+
+        see: `tree.JobcodeTree`
+        """
+        if self._jobcode_tree is None:
+            self._jobcode_tree = JobcodeTree(self).load(strategy=strategy)
+        elif refresh:
+            self._jobcode_tree.refresh()
+        return self._jobcode_tree
+
+    def __fetch_rows(self, model, **kwargs):
+        """
+        returns the raw result rows of every page of a query, fetched serially
+        """
+        rows = []
+        for page_json in self._iter_pages(model, prefetch=0, **kwargs):
+            rows.extend(self._result_rows(model, page_json))
+        return rows
+
+    def __get_by_ids(self, model, ids, use_identity_map, **kwargs):
+        """
+        fetches the records of `model` with the given ids, in batches of ids fitting in a URL which are fetched
+        concurrently, and returns them indexed by id. Records found in the identity map are not fetched
+        when `use_identity_map` is True.
+        """
+        if not isinstance(ids, (list, tuple, set, frozenset)):
+            ids = str(ids).split(",")
+        result = {}
+        missing = []
+        seen = set()
+        for tsobject_id in ids:
+            tsobject_id = int(tsobject_id)
+            if tsobject_id in seen:
+                continue
+            seen.add(tsobject_id)
+            instance = self.identity_map.get(model, tsobject_id) if use_identity_map else None
+            if instance is not None:
+                result[tsobject_id] = instance
+            else:
+                missing.append(str(tsobject_id))
+
+        # chunked by URL length rather than by number of ids (see `batch.batches`)
+        id_batches = []
+        batch = []
+        length = 0
+        for tsobject_id in missing:
+            if batch and length + len(tsobject_id) + 1 > self._max_ids_length:
+                id_batches.append(batch)
+                batch = []
+                length = 0
+            batch.append(tsobject_id)
+            length += len(tsobject_id) + 1
+        if batch:
+            id_batches.append(batch)
+
+        if len(id_batches) > 1:
+            pool = self._get_pool()
+            pending = [pool.apply_async(self.__fetch_rows, (model,), dict(kwargs, ids=",".join(b)))
+                       for b in id_batches]
+            batch_rows = [async_result.get() for async_result in pending]
+        else:
+            batch_rows = [self.__fetch_rows(model, ids=",".join(b), **kwargs) for b in id_batches]
+
+        shared = model in self._supplemental_models.values()
+        for rows in batch_rows:
+            for tsobject in rows:
+                result[tsobject['id']] = self._hydrate(model, tsobject) if shared else model(api=self, **tsobject)
+        return result
+
+    def get_timesheets_by_ids(self, ids, **kwargs):
+        """
+        Retrieves the timesheets with the given ids, chunking the ids in URL-safe batches fetched concurrently.
+
+        args:
+            ids (list or str) : list, or comma separated string, of timesheet ids
+            kwargs: see `API.list_timesheets` method. `on_the_clock` defaults to 'both'.
+
+        returns:
+            dict of Timesheet objects indexed by id. Ids which were not found are missing.
+        """
+        kwargs.setdefault('on_the_clock', 'both')
+        return self.__get_by_ids(Timesheet, ids, False, **kwargs)
+
+    def get_users_by_ids(self, ids, use_identity_map=True, **kwargs):
+        """
+        Retrieves the users with the given ids, chunking the ids in URL-safe batches fetched concurrently.
+
+        args:
+            ids (list or str)       : list, or comma separated string, of user ids
+            use_identity_map (bool) : if True, users already in the identity map are not fetched again
+            kwargs: see `API.list_users` method. `active` defaults to 'both'.
+
+        returns:
+            dict of User objects indexed by id. Ids which were not found are missing.
+        """
+        kwargs.setdefault('active', 'both')
+        return self.__get_by_ids(User, ids, use_identity_map, **kwargs)
+
+    def get_jobcodes_by_ids(self, ids, use_identity_map=True, **kwargs):
+        """
+        Retrieves the jobcodes with the given ids, chunking the ids in URL-safe batches fetched concurrently.
+
+        args:
+            ids (list or str)       : list, or comma separated string, of jobcode ids
+            use_identity_map (bool) : if True, jobcodes already in the identity map are not fetched again
+            kwargs: see `API.list_jobcodes` method. `active` defaults to 'both' and `type` to 'all'.
+
+        returns:
+            dict of Jobcode objects indexed by id. Ids which were not found are missing.
+        """
+        kwargs.setdefault('active', 'both')
+        kwargs.setdefault('type', 'all')
+        return self.__get_by_ids(Jobcode, ids, use_identity_map, **kwargs)
+
+    def export(self, model, path, format='ndjson', fields=None, compress=False, checkpoint=None, shard_days=None,
+               **kwargs):
+        """
+        Streams every record of `model` matching the filters in kwargs to `path`, page by page, resuming from
+        the checkpoint of an interrupted export. Returns the number of records exported.
+
+        args:
+            model (class) : the TSheetsObject class of the endpoint to export (i.e. Timesheet)
+            path (str)    : output file, or directory for the 'columnar' format
+            format (str)  : 'ndjson', 'csv' or 'columnar'
+            kwargs: the filters of the model's list method (i.e. see `API.list_timesheets`)
+
+        see: `export.Exporter` for the other arguments
+        """
+        exporter = Exporter(self, model, path, format=format, fields=fields, compress=compress,
+                            checkpoint=checkpoint, shard_days=shard_days)
+        return exporter.run(**kwargs)
+
+    def iter_users(self, **kwargs):
+        """
+        generator which yields every User matching the filters, fetching one page at a time.
+
+        see: `API.list_users`
+        """
+        return self.__iter_TSObjects(User, **kwargs)
+
+    def iter_jobcodes(self, **kwargs):
+        """
+        generator which yields every Jobcode matching the filters, fetching one page at a time.
+
+        see: `API.list_jobcodes`
+        """
+        return self.__iter_TSObjects(Jobcode, **kwargs)
+
+    def iter_jobcode_assignments(self, **kwargs):
+        """
+        generator which yields every JobcodeAssignment matching the filters, fetching one page at a time.
+
+        see: `API.list_jobcode_assignments`
+        """
+        return self.__iter_TSObjects(JobcodeAssignment, **kwargs)
+
+    def iter_timesheets(self, **kwargs):
+        """
+        generator which yields every Timesheet matching the filters, fetching one page at a time.
+
+        see: `API.list_timesheets`
+        """
+        return self.__iter_TSObjects(Timesheet, **kwargs)
+
+    def __send_batch(self, model, method, batch):
+        """
+        sends a single write request of up to `_max_batch_size` records (or ids, for 'delete')
+        """
+        url = self._base_url + model._endpoint_name
+        if method == 'delete':
+            return self._scheduler.request(self._session.delete, url,
+                                           params={'ids': ",".join(str(i) for i in batch)}, timeout=self._timeout)
+        if method == 'put':
+            return self._scheduler.request(self._session.put, url, json={'data': batch}, timeout=self._timeout)
+        return self._scheduler.request_non_idempotent(self._session.post, url, json={'data': batch},
+                                                      timeout=self._timeout)
+
+    def __batch_results(self, model, method, offset, batch, async_result):
+        """
+        maps the response of a write request back to its input records, as a list of WriteResult
+        """
+        try:
+            response = async_result.get()
+        except (requests.RequestException, HTTPException) as error:
+            return [WriteResult(offset + i, record, None, str(error)) for i, record in enumerate(batch)]
+        if response.status_code not in (200, 207):
+            error = TSheetsError(response.status_code, response.content)
+            return [WriteResult(offset + i, record, response.status_code, error.error_message)
+                    for i, record in enumerate(batch)]
+
+        rows = self._decode(response.content).get('results', {}).get(model._result_object_key, {})
+        if method == 'delete' and not hasattr(rows, 'get'):
+            rows = dict((str(row.get('id')), row) for row in rows)
+        results = []
+        for i, record in enumerate(batch):
+            if method == 'delete':
+                # deletions are reported by id, created and updated records by position
+                row = rows.get(str(record))
+            elif hasattr(rows, 'get'):
+                row = rows.get(str(i + 1))
+            else:
+                row = rows[i] if i < len(rows) else None
+            if not row:
+                results.append(WriteResult(offset + i, record, None, "missing from the response"))
+                continue
+            status_code = int(row.get('_status_code', response.status_code))
+            message = row.get('_status_message')
+            tsobject = None
+            if method != 'delete' and 200 <= status_code < 300:
+                fields = dict((k, v) for k, v in row.items() if not k.startswith('_'))
+                if model in self._supplemental_models.values():
+                    tsobject = self._hydrate(model, fields)
+                else:
+                    tsobject = model(api=self, **fields)
+            results.append(WriteResult(offset + i, record, status_code, message, tsobject))
+        return results
+
+    def __write(self, model, method, records):
+        """
+        packs `records` (any iterable) in batches of `_max_batch_size`, sends the batches concurrently in the
+        client's thread pool, under its rate limiter, and returns a BatchResult in input order
+        """
+        result = BatchResult()
+        pool = self._get_pool()
+        pending = deque()
+        offset = 0
+        try:
+            for batch in batches(records, self._max_batch_size):
+                pending.append((offset, batch, pool.apply_async(self.__send_batch, (model, method, batch))))
+                offset += len(batch)
+                if len(pending) >= self._max_workers:
+                    result.extend(self.__batch_results(model, method, *pending.popleft()))
+            while pending:
+                result.extend(self.__batch_results(model, method, *pending.popleft()))
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(model._endpoint_name)
+        return result
+
+    def create_timesheets(self, timesheets):
+        """
+        Creates timesheets, in batches sent concurrently.
+
+        args:
+            timesheets (iterable of dict) : the timesheets to create, following the format of the API
+                (i.e. {"user_id": 1, "jobcode_id": 2, "type": "manual", "date": "2014-09-08", "duration": 3600})
+
+        returns:
+            BatchResult : one WriteResult per input timesheet, in input order. Check `failures` for the
+                             timesheets which were rejected.
+
+        see: http://developers.tsheets.com/docs/api/timesheets/add-timesheets
+        """
+        return self.__write(Timesheet, 'post', timesheets)
+
+    def update_timesheets(self, timesheets):
+        """
+        Updates timesheets, in batches sent concurrently. Each timesheet (dict) must have an `id`.
+
+        returns:
+            BatchResult : see `API.create_timesheets`
+
+        see: http://developers.tsheets.com/docs/api/timesheets/edit-timesheets
+        """
+        return self.__write(Timesheet, 'put', timesheets)
+
+    def delete_timesheets(self, ids):
+        """
+        Deletes the timesheets with the given ids, in batches sent concurrently.
+
+        returns:
+            BatchResult : see `API.create_timesheets`
+
+        see: http://developers.tsheets.com/docs/api/timesheets/delete-timesheets
+        """
+        return self.__write(Timesheet, 'delete', ids)
+
+    def create_jobcodes(self, jobcodes):
+        """
+        Creates jobcodes, in batches sent concurrently. Jobcodes cannot be deleted, they are archived by
+        updating `active` to False.
+
+        returns:
+            BatchResult : see `API.create_timesheets`
+
+        see: http://developers.tsheets.com/docs/api/jobcodes/add-jobcodes
+        """
+        return self.__write(Jobcode, 'post', jobcodes)
+
+    def update_jobcodes(self, jobcodes):
+        """
+        Updates jobcodes, in batches sent concurrently. Each jobcode (dict) must have an `id`.
+
+        returns:
+            BatchResult : see `API.create_timesheets`
+
+        see: http://developers.tsheets.com/docs/api/jobcodes/edit-jobcodes
+        """
+        return self.__write(Jobcode, 'put', jobcodes)
+
+    def create_jobcode_assignments(self, assignments):
+        """
+        Creates jobcode assignments ({"user_id": 1, "jobcode_id": 2}), in batches sent concurrently.
+
+        returns:
+            BatchResult : see `API.create_timesheets`
+
+        see: http://developers.tsheets.com/docs/api/jobcode_assignments/add-jobcode-assignments
+        """
+        return self.__write(JobcodeAssignment, 'post', assignments)
+
+    def delete_jobcode_assignments(self, ids):
+        """
+        Deletes the jobcode assignments with the given ids, in batches sent concurrently.
+
+        returns:
+            BatchResult : see `API.create_timesheets`
+
+        see: http://developers.tsheets.com/docs/api/jobcode_assignments/delete-jobcode-assignments
+        """
+        return self.__write(JobcodeAssignment, 'delete', ids)
+
     def get_payroll_report(self, **kwargs):
         """
         Retrieves a payroll report associated with a timeframe
@@ -250,6 +1005,43 @@ class API(object):
         """
         return self.__get_TSObjects(PayrollReport, **kwargs)
 
+    def get_payroll_report_parallel(self, start_date, end_date, period_days=None, id_chunk_size=50, **kwargs):
+        """
+        Retrieves the payroll report of a timeframe by splitting the request in pay period windows of
+        `period_days` days and in chunks of `id_chunk_size` user_ids (or group_ids), running the pieces
+        concurrently in the client's thread pool and merging them back in one PayrollReport per user.
+
+        Overtime is computed by TSheets within each window, so `period_days` should match the pay periods
+        (or overtime weeks) of the company.
+
+        args:
+            start_date (str)    : required. YYYY-MM-DD formatted date.
+            end_date (str)      : required. YYYY-MM-DD formatted date.
+            period_days (int)   : size, in days, of a window. Default is the whole timeframe.
+            id_chunk_size (int) : maximum number of user/group ids per request
+            kwargs: see `API.get_payroll_report` method
+
+        returns:
+            list of PayrollReport, ordered by user id
+        """
+        if not period_days:
+            period_days = (TimesheetQueryPlanner._parse_date(end_date) -
+                           TimesheetQueryPlanner._parse_date(start_date)).days + 1
+        planner = TimesheetQueryPlanner(self, shard_days=period_days, id_chunk_size=id_chunk_size)
+        pool = self._get_pool()
+        # the shards run in the thread pool: their pages are fetched serially, not prefetched in the same pool
+        pending = [pool.apply_async(self.__get_TSObjects, (PayrollReport,), dict(params, prefetch=0))
+                   for params in planner.shards(start_date, end_date, **kwargs)]
+
+        reports = {}
+        for async_result in pending:
+            for report in async_result.get():
+                if report.user_id in reports:
+                    reports[report.user_id].merge(report)
+                else:
+                    reports[report.user_id] = report
+        return [reports[user_id] for user_id in sorted(reports)]
+
     def list_jobcodes_by_user(self, user_ids, exclude_global=True, **kwargs):
         """
         Returns a list of all user_jobcodes assigned to users whose ids are in `user_ids`
@@ -282,24 +1074,38 @@ class API(object):
 
         kwargs.update({'user_ids': str(user_ids)})
 
-        raw_assignments = self.get_json(JobcodeAssignment, **kwargs)
-        if not raw_assignments.get('supplemental_data'):
+        # build the user_id -> jobcode_ids index and collect the supplemental data of every page
+        users = {}
+        jobcodes = {}
+        user_jobcode_ids = {}
+        has_supplemental_data = False
+        for page_json in self._iter_pages(JobcodeAssignment, **kwargs):
+            supplemental_data = page_json.get('supplemental_data')
+            if supplemental_data:
+                has_supplemental_data = True
+                users.update(supplemental_data.get("users", {}))
+                jobcodes.update(supplemental_data.get("jobcodes", {}))
+            for assignment in self._result_rows(JobcodeAssignment, page_json):
+                user_jobcode_ids.setdefault(assignment["user_id"], []).append(assignment["jobcode_id"])
+        if not has_supplemental_data:
             return None
 
-        users = raw_assignments.get('supplemental_data').get("users", {})
-        # initialize result with user_ids as keys, and user objects in values
-        result = {u["id"]:{"user": User(api=self, **u), "jobcodes": []} for u in users.values()}
-        assignments = raw_assignments.get("results").get("jobcode_assignments", {})
-        jobcodes = raw_assignments.get('supplemental_data').get('jobcodes', {})
-
-        for uid, udata in result.iteritems():
-            user_jobcode_ids = [a["jobcode_id"] for a in assignments.values() if a["user_id"] == uid]
-            user_jobcodes = [Jobcode(api=self, **j) for j in jobcodes.values() \
-                                if j["id"] in user_jobcode_ids and not j['has_children']]
-            if excl:
-                user_jobcodes = [j for j in user_jobcodes if j.assigned_to_all]
-            udata["jobcodes"] = user_jobcodes
-            result[uid] = udata
+        # jobcode_id -> Jobcode index (excluding parent jobcodes), sharing instances through the identity map
+        jobcode_index = {}
+        for j in jobcodes.itervalues():
+            if j['has_children'] or (excl and not j.get('assigned_to_all')):
+                continue
+            jobcode_index[j["id"]] = self._hydrate(Jobcode, j)
+
+        result = {}
+        for u in users.itervalues():
+            user_jobcodes = []
+            seen = set()
+            for jobcode_id in user_jobcode_ids.get(u["id"], []):
+                if jobcode_id in jobcode_index and jobcode_id not in seen:
+                    seen.add(jobcode_id)
+                    user_jobcodes.append(jobcode_index[jobcode_id])
+            result[u["id"]] = {"user": self._hydrate(User, u), "jobcodes": user_jobcodes}
         return result
 
     def grouped_timesheets(self, user_ids, start_date, end_date, active='yes', exclude_global=False):
@@ -341,34 +1147,47 @@ class API(object):
         uids = [uid.strip() for uid in user_ids.split(",")]
         user_ids = ",".join(uids)
 
-        jobcodes = self.list_jobcodes_by_user(user_ids=user_ids, active=active, exclude_global=exclude_global)
-        ts_json = self.get_json(Timesheet, user_ids=user_ids, start_date=start_date, end_date=end_date)
-        timesheets = ts_json["results"]["timesheets"].values()
-        users = ts_json["supplemental_data"]["users"]
+        # index the raw timesheets by (user_id, jobcode_id) in a single pass
+        ts_index = {}
+        if self.store is not None and active == 'yes':
+            # answer locally after a delta sync
+            self.store.sync()
+            jobcodes = self.store.list_jobcodes_by_user(user_ids, exclude_global=exclude_global) or {}
+            users = dict((str(u["id"]), u) for u in self.store.user_rows(user_ids))
+            for ts in self.store.timesheet_rows(user_ids=user_ids, start_date=start_date, end_date=end_date):
+                ts_index.setdefault((ts["user_id"], ts["jobcode_id"]), []).append(ts)
+        else:
+            jobcodes = self.list_jobcodes_by_user(user_ids=user_ids, active=active,
+                                                  exclude_global=exclude_global) or {}
+            users = {}
+            for page_json in self._iter_pages(Timesheet, user_ids=user_ids, start_date=start_date,
+                                              end_date=end_date):
+                users.update((page_json.get("supplemental_data") or {}).get("users", {}))
+                for ts in self._result_rows(Timesheet, page_json):
+                    ts_index.setdefault((ts["user_id"], ts["jobcode_id"]), []).append(ts)
 
         grouped_ts = {int(uid):{"user":None, "jobcodes":{}, "summary":{}} for uid in uids}
         all_user_hours = 0.0
 
         for user_id, user_data in grouped_ts.iteritems():
-            user_data["user"] = User(api=self, **users[str(user_id)])
+            user_jobcodes = jobcodes.get(user_id, {})
+            if str(user_id) in users:
+                user_data["user"] = self._hydrate(User, users[str(user_id)])
+            else:
+                user_data["user"] = user_jobcodes.get("user")
             user_total_hours = 0.0
-            user_jobcodes = jobcodes[user_id]["jobcodes"]
             tmp_jobcodes = {}
-            for jobcode in user_jobcodes:
-                tmp_jobcodes[str(jobcode.id)] = {}
+            for jobcode in user_jobcodes.get("jobcodes", []):
                 # create a list of Timesheet objects
-                user_ts = [Timesheet(api=self, **ts) for ts in timesheets if ts["jobcode_id"] == jobcode.id]
+                user_ts = [Timesheet(api=self, **ts) for ts in ts_index.get((user_id, jobcode.id), [])]
                 ts_hours = sum([uts.tshours for uts in user_ts])
                 user_total_hours += ts_hours
                 # total hours per jobcode
-                tmp_jobcodes[str(jobcode.id)]["total_hours"] = ts_hours
-                tmp_jobcodes[str(jobcode.id)]["jobcode"] = jobcode
-                tmp_jobcodes[str(jobcode.id)]["timesheets"] = user_ts
+                tmp_jobcodes[str(jobcode.id)] = {"total_hours": ts_hours, "jobcode": jobcode, "timesheets": user_ts}
             all_user_hours += user_total_hours
             user_data["jobcodes"] = tmp_jobcodes
             # total hours per user
             user_data["summary"]["total_hours"] = user_total_hours
-            grouped_ts[user_id] = user_data
         grouped_ts.update({"summary":{"total_hours": all_user_hours}})
 
         return grouped_ts
@@ -0,0 +1,306 @@
+import datetime
+import json
+import sqlite3
+import threading
+from .cache import ResponseCache
+from .models import User, Timesheet, PayrollReport
+from .planner import DATE_FORMAT
+
+
+def _shift(date, days):
+    """
+    returns the YYYY-MM-DD date `days` days after `date`
+    """
+    return (datetime.datetime.strptime(date, DATE_FORMAT) + datetime.timedelta(days=days)).strftime(DATE_FORMAT)
+
+
+class TimesheetArchive(object):
+    """
+    A permanent on-disk (SQLite) tier for the records TSheets no longer lets anyone change: the timesheets dated
+    on or before their user's `approved_to` date, and the payroll reports of approved periods.
+
+    For every user, the archive remembers which date ranges of approved time it holds in full. A timesheets query
+    with `user_ids`, `start_date` and `end_date` is then answered with the archived part of the range, and only
+    the rest is requested from TSheets: the approved dates not archived yet (which are archived on the way) and
+    the mutable tail after `approved_to`. The `approved_to` date of every user is looked up on each query, so
+    that time which is unapproved again is dropped from the archive.
+
+    The pages served from the archive carry the users of their timesheets as supplemental data, but not their
+    jobcodes. The `more` flag of each page only describes the query it belongs to. The archive fetches pages one
+    at a time (without prefetching), as it is also used from the client's thread pool.
+
+    args:
+        path (str) : path of the SQLite database. Default is an in-memory database.
+
+    usage:
+        tsclient = api.API(token, archive=TimesheetArchive("archive.db"))
+        timesheets = tsclient.list_timesheets(user_ids="1,2", start_date="2012-01-01", end_date="2014-12-31")
+    """
+
+    # filters of the timesheets queries the archive can take part in
+    timesheet_filters = frozenset(['user_ids', 'start_date', 'end_date', 'on_the_clock', 'per_page', 'prefetch'])
+    # filters of the payroll report queries the archive can answer
+    payroll_filters = frozenset(['user_ids', 'start_date', 'end_date', 'include_zero_time', 'prefetch'])
+    # number of archived timesheets per page
+    page_size = 500
+    # maximum number of user ids sent in a single users request
+    user_ids_per_request = 200
+
+    def __init__(self, path=":memory:"):
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS timesheets (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS timesheets_user_date ON timesheets (user_id, date);
+            CREATE TABLE IF NOT EXISTS coverage (
+                user_id INTEGER NOT NULL,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS coverage_user ON coverage (user_id);
+            CREATE TABLE IF NOT EXISTS payroll_reports (
+                key TEXT PRIMARY KEY,
+                end_date TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS payroll_report_users (
+                key TEXT NOT NULL,
+                user_id INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS payroll_report_users_user ON payroll_report_users (user_id);
+        """)
+
+    @staticmethod
+    def _ids(ids):
+        return [int(i) for i in str(ids).split(",") if i.strip()]
+
+    def answers(self, model, kwargs):
+        """
+        returns True if the archive can take part in the query of `model` with the filters in `kwargs`
+        """
+        if model is Timesheet:
+            return (bool(kwargs.get('user_ids') and kwargs.get('start_date') and kwargs.get('end_date')) and
+                    kwargs.get('on_the_clock', 'no') in ('no', 'both') and
+                    self.timesheet_filters.issuperset(kwargs))
+        if model is PayrollReport:
+            return (bool(kwargs.get('user_ids') and kwargs.get('start_date') and kwargs.get('end_date')) and
+                    self.payroll_filters.issuperset(kwargs))
+        return False
+
+    def pages(self, api, model, **kwargs):
+        """
+        returns an iterator over the JSON responses (dicts) answering a query the archive `answers`, served from
+        the archive or fetched with `api`
+
+        raises:
+            TSheetsError
+            HTTPException
+        """
+        if model is PayrollReport:
+            return self._payroll_pages(api, **kwargs)
+        return self._timesheet_pages(api, **kwargs)
+
+    def _users(self, api, user_ids):
+        """
+        returns the raw rows of the given users, indexed by id, and drops from the archive whatever they no longer
+        have approved
+        """
+        users = {}
+        for i in range(0, len(user_ids), self.user_ids_per_request):
+            ids = ",".join(str(user_id) for user_id in user_ids[i:i + self.user_ids_per_request])
+            for page_json in api._iter_api_pages(User, ids=ids, active='both', prefetch=0):
+                for row in api._result_rows(User, page_json):
+                    users[row['id']] = row
+        with self._lock:
+            for user_id in user_ids:
+                self._revoke(user_id, self._approved_to(users.get(user_id)))
+            self._connection.commit()
+        return users
+
+    @staticmethod
+    def _approved_to(user):
+        """
+        returns the YYYY-MM-DD date up to which the time of a user (raw row) is approved, or None
+        """
+        approved_to = (user or {}).get('approved_to')
+        if not approved_to or approved_to.startswith('0000'):
+            return None
+        return approved_to[:10]
+
+    def _coverage(self, user_id):
+        """
+        returns the sorted (start_date, end_date) ranges of approved time archived for a user
+        """
+        with self._lock:
+            return self._connection.execute("SELECT start_date, end_date FROM coverage WHERE user_id = ? "
+                                            "ORDER BY start_date", (user_id,)).fetchall()
+
+    def _set_coverage(self, user_id, ranges):
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= _shift(merged[-1][1], 1):
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        self._connection.execute("DELETE FROM coverage WHERE user_id = ?", (user_id,))
+        self._connection.executemany("INSERT INTO coverage (user_id, start_date, end_date) VALUES (?, ?, ?)",
+                                     [(user_id, start, end) for start, end in merged])
+
+    def _revoke(self, user_id, approved_to):
+        """
+        drops the archived time of a user dated after `approved_to` (all of it when None)
+        """
+        cutoff = approved_to or ""
+        ranges = self._coverage(user_id)
+        if not any(end > cutoff for _, end in ranges):
+            return
+        self._set_coverage(user_id, [(start, min(end, cutoff)) for start, end in ranges if start <= cutoff])
+        self._connection.execute("DELETE FROM timesheets WHERE user_id = ? AND date > ?", (user_id, cutoff))
+        self._connection.execute("DELETE FROM payroll_reports WHERE end_date > ? AND key IN "
+                                 "(SELECT key FROM payroll_report_users WHERE user_id = ?)", (cutoff, user_id))
+        self._connection.execute("DELETE FROM payroll_report_users WHERE key NOT IN "
+                                 "(SELECT key FROM payroll_reports)")
+
+    def _plan(self, user_id, approved_to, start_date, end_date):
+        """
+        returns the date ranges of `start_date`..`end_date` served from the archive for a user, and those which
+        must be fetched from TSheets (adjacent ranges being merged)
+        """
+        archived = []
+        fetched = []
+        frozen_to = min(end_date, approved_to) if approved_to else None
+        if frozen_to and frozen_to >= start_date:
+            cursor = start_date
+            for start, end in self._coverage(user_id):
+                if end < cursor or start > frozen_to:
+                    continue
+                if start > cursor:
+                    fetched.append((cursor, _shift(start, -1)))
+                archived.append((max(start, cursor), min(end, frozen_to)))
+                cursor = _shift(end, 1)
+                if cursor > frozen_to:
+                    break
+            if cursor <= frozen_to:
+                fetched.append((cursor, frozen_to))
+            tail = _shift(frozen_to, 1)
+        else:
+            tail = start_date
+        if tail <= end_date:
+            fetched.append((tail, end_date))
+
+        merged = []
+        for start, end in fetched:
+            if merged and start == _shift(merged[-1][1], 1):
+                merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        return archived, merged
+
+    def _timesheet_pages(self, api, user_ids, start_date, end_date, **kwargs):
+        kwargs.pop('prefetch', None)
+        user_ids = self._ids(user_ids)
+        users = self._users(api, user_ids)
+        approved = dict((user_id, self._approved_to(users.get(user_id))) for user_id in user_ids)
+
+        archived = []
+        plans = {}
+        for user_id in user_ids:
+            user_archived, fetched = self._plan(user_id, approved[user_id], start_date, end_date)
+            archived.extend((user_id, start, end) for start, end in user_archived)
+            if fetched:
+                plans.setdefault(tuple(fetched), []).append(user_id)
+
+        for page_json in self._archived_pages(archived, users, bool(plans)):
+            yield page_json
+
+        for fetched, plan_user_ids in sorted(plans.items()):
+            for start, end in fetched:
+                for page_json in api._iter_api_pages(Timesheet, start_date=start, end_date=end,
+                                                     user_ids=",".join(str(i) for i in plan_user_ids), prefetch=0,
+                                                     **kwargs):
+                    self._store(api._result_rows(Timesheet, page_json), approved)
+                    yield page_json
+                with self._lock:
+                    for user_id in plan_user_ids:
+                        if approved[user_id] and start <= approved[user_id]:
+                            self._set_coverage(user_id, self._coverage(user_id) +
+                                               [(start, min(end, approved[user_id]))])
+                    self._connection.commit()
+
+    def _archived_pages(self, archived, users, more):
+        """
+        generator which yields the archived timesheets of the (user_id, start_date, end_date) ranges in `archived`
+        as JSON responses of up to `page_size` timesheets
+        """
+        rows = []
+        for user_id, start, end in archived:
+            with self._lock:
+                rows.extend(json.loads(data) for (data,) in self._connection.execute(
+                    "SELECT data FROM timesheets WHERE user_id = ? AND date BETWEEN ? AND ? ORDER BY date, id",
+                    (user_id, start, end)))
+            while len(rows) >= self.page_size:
+                yield self._page(rows[:self.page_size], users, True)
+                rows = rows[self.page_size:]
+        if rows:
+            yield self._page(rows, users, more)
+
+    @staticmethod
+    def _page(rows, users, more):
+        page_users = dict((str(row['user_id']), users[row['user_id']]) for row in rows if row['user_id'] in users)
+        return {
+            'results': {'timesheets': dict((str(row['id']), row) for row in rows)},
+            'more': more,
+            'supplemental_data': {'users': page_users},
+        }
+
+    def _store(self, rows, approved):
+        """
+        archives the timesheets dated on or before the `approved_to` date of their user
+        """
+        saved = [(row['id'], row['user_id'], row['date'], json.dumps(row)) for row in rows
+                 if approved.get(row['user_id']) and row['date'] <= approved[row['user_id']]]
+        if saved:
+            with self._lock:
+                self._connection.executemany("INSERT OR REPLACE INTO timesheets (id, user_id, date, data) "
+                                             "VALUES (?, ?, ?, ?)", saved)
+
+    def _payroll_pages(self, api, **kwargs):
+        kwargs.pop('prefetch', None)
+        user_ids = self._ids(kwargs['user_ids'])
+        users = self._users(api, user_ids)
+        approved = [self._approved_to(users.get(user_id)) for user_id in user_ids]
+        if not all(approved_to and approved_to >= kwargs['end_date'] for approved_to in approved):
+            return api._iter_api_pages(PayrollReport, prefetch=0, **kwargs)
+
+        key = json.dumps(ResponseCache.key(PayrollReport._endpoint_name, kwargs))
+        with self._lock:
+            row = self._connection.execute("SELECT data FROM payroll_reports WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            return json.loads(row[0])
+
+        pages = list(api._iter_api_pages(PayrollReport, prefetch=0, **kwargs))
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO payroll_reports (key, end_date, data) VALUES (?, ?, ?)",
+                                     (key, kwargs['end_date'], json.dumps(pages)))
+            self._connection.execute("DELETE FROM payroll_report_users WHERE key = ?", (key,))
+            self._connection.executemany("INSERT INTO payroll_report_users (key, user_id) VALUES (?, ?)",
+                                         [(key, user_id) for user_id in user_ids])
+            self._connection.commit()
+        return pages
+
+    def clear(self):
+        """
+        drops everything the archive holds
+        """
+        with self._lock:
+            self._connection.executescript("DELETE FROM timesheets; DELETE FROM coverage; "
+                                           "DELETE FROM payroll_reports; DELETE FROM payroll_report_users;")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,62 @@
+from itertools import islice
+
+
+def batches(iterable, size):
+    """
+    generator which yields lists of up to `size` items taken from `iterable`, without consuming it upfront
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class WriteResult(object):
+    """
+    The outcome of writing a single record through one of the batched write methods of `API`
+
+    Attributes:
+        index (int)       : position of the record in the input of the write method
+        record (dict/int) : the input record (or id, for deletions)
+        status_code (int) : status code reported for this record. None when the request itself failed
+                               before reaching TSheets, or when its response did not report the record.
+        message (str)     : status message reported for this record
+        tsobject          : the created/updated TSheets object, as returned by the API (None for deletions
+                               and failures)
+    """
+
+    __slots__ = ("index", "record", "status_code", "message", "tsobject")
+
+    def __init__(self, index, record, status_code, message, tsobject=None):
+        self.index = index
+        self.record = record
+        self.status_code = status_code
+        self.message = message
+        self.tsobject = tsobject
+
+    @property
+    def ok(self):
+        return self.status_code is not None and 200 <= self.status_code < 300
+
+    def __repr__(self):
+        return "<WriteResult #{}: {} {}>".format(self.index, self.status_code, self.message)
+
+
+class BatchResult(list):
+    """
+    The list of WriteResult of a batched write, in input order
+    """
+
+    @property
+    def succeeded(self):
+        return [result for result in self if result.ok]
+
+    @property
+    def failures(self):
+        return [result for result in self if not result.ok]
+
+    @property
+    def ok(self):
+        return all(result.ok for result in self)
@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache(object):
+    """
+    A size-bounded LRU cache of decoded API responses with per-endpoint TTLs.
+
+    Responses are keyed by endpoint plus normalized query parameters. Timesheet queries which include timesheets
+    that are on the clock (`on_the_clock` 'yes' or 'both') use the short `on_the_clock_ttl`.
+
+    Any object providing the `get`, `set` and `invalidate` methods below can be plugged into `API` instead.
+    Cached responses are shared between callers and must not be modified.
+
+    args:
+        max_entries (int)  : maximum number of responses kept, least recently used ones being evicted first
+        default_ttl (int)  : time to live, in seconds, of the responses of endpoints missing from `ttls`
+        ttls (dict)        : time to live, in seconds, indexed by endpoint name. Updates `default_ttls`.
+        on_the_clock_ttl (int) : time to live, in seconds, of timesheet queries including on the clock timesheets
+    """
+
+    default_ttls = {
+        "current_user": 300,
+        "users": 300,
+        "jobcodes": 3600,
+        "jobcode_assignments": 600,
+        "timesheets": 60,
+        "reports/payroll": 60,
+    }
+
+    def __init__(self, max_entries=512, default_ttl=60, ttls=None, on_the_clock_ttl=5):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls = dict(self.default_ttls)
+        self.ttls.update(ttls or {})
+        self.on_the_clock_ttl = on_the_clock_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(endpoint, params):
+        """
+        returns the cache key of a request, ignoring the order of the parameters and spaces around commas
+        """
+        normalized = []
+        for k, v in (params or {}).items():
+            v = ResponseCache._text(v)
+            normalized.append((k, ",".join(part.strip() for part in v.split(","))))
+        return endpoint, tuple(sorted(normalized))
+
+    @staticmethod
+    def _text(value):
+        """
+        returns a parameter value as a byte string, unicode values (i.e. name filters) being encoded as UTF-8
+        """
+        if isinstance(value, unicode):
+            return value.encode("utf-8")
+        if isinstance(value, bytes):
+            return value
+        try:
+            return str(value)
+        except UnicodeError:
+            return repr(value)
+
+    def ttl(self, endpoint, params):
+        """
+        returns the time to live, in seconds, of the response of a request
+        """
+        if endpoint == "timesheets" and (params or {}).get("on_the_clock") in ("yes", "both"):
+            return self.on_the_clock_ttl
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    def get(self, endpoint, params):
+        """
+        returns the cached response of a request, or None when it is missing or expired
+        """
+        key = self.key(endpoint, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            # mark as most recently used
+            del self._entries[key]
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def set(self, endpoint, params, response):
+        """
+        caches the response of a request
+        """
+        ttl = self.ttl(endpoint, params)
+        if ttl <= 0:
+            return
+        key = self.key(endpoint, params)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + ttl, response)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, endpoint=None):
+        """
+        drops every cached response of `endpoint`, or of every endpoint when `endpoint` is None
+        """
+        with self._lock:
+            if endpoint is None:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if k[0] == endpoint]:
+                del self._entries[key]
+
+    def stats(self):
+        """
+        returns the hit/miss counters and current size of the cache
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "size": len(self._entries)}
@@ -0,0 +1,48 @@
+import json
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+
+def _json_loads(content):
+    # on Python 2, the standard library scans unicode text faster than UTF-8 byte strings
+    return json.loads(content.decode("utf-8") if isinstance(content, bytes) else content)
+
+
+# decoders indexed by name, from the fastest to the slowest. Each one takes the raw (UTF-8) body of a response.
+decoders = {"json": _json_loads}
+preference = ["json"]
+if simplejson is not None:
+    decoders["simplejson"] = simplejson.loads
+    preference.insert(0, "simplejson")
+if ujson is not None:
+    decoders["ujson"] = ujson.loads
+    preference.insert(0, "ujson")
+
+
+def get_decoder(decoder=None):
+    """
+    returns the callable which decodes the raw body of a response. The fastest library installed is used by
+    default: ujson, then simplejson, then the standard library's json.
+
+    args:
+        decoder (str/callable) : the name of an installed library ('ujson', 'simplejson' or 'json'), or any
+                                    callable taking a byte string. Default is the fastest library installed.
+
+    raises:
+        ValueError : when the requested library is not installed
+    """
+    if decoder is None:
+        return decoders[preference[0]]
+    if callable(decoder):
+        return decoder
+    if decoder not in decoders:
+        raise ValueError("JSON decoder not available: {}".format(decoder))
+    return decoders[decoder]
@@ -9,7 +9,11 @@ class TSheetsError(Exception):
     """
 
     def __init__(self, status_code, response, *args, **kwargs):
-        self.error_dict = json.loads(response)
+        try:
+            self.error_dict = json.loads(response)
+        except ValueError:
+            # i.e. an HTML error page from a proxy or load balancer
+            self.error_dict = {'error': {'code': status_code, 'message': response}}
         self.status_code = str(status_code)
         if self.error_dict.has_key('error_description'):
             self.error_code = self.error_dict['error']
@@ -0,0 +1,209 @@
+import csv
+import gzip
+import io
+import json
+import os
+from collections import OrderedDict
+from .models import Timesheet
+from .planner import TimesheetQueryPlanner
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Exporter(object):
+    """
+    Streams the results of a list endpoint to a file, page by page, in flat memory.
+
+    Formats:
+        ndjson   : one JSON object per line
+        csv      : a header line followed by one line per record. Nested values (dicts, lists) are JSON encoded.
+        columnar : a directory of NumPy `.npz` parts (requires numpy), one array per field and per part
+
+    Pages are buffered up to `buffer_pages` at a time, then written out and followed by a checkpoint recording
+    the last completed shard and page, and the size of the output. An interrupted export run again with the same
+    arguments resumes after the last checkpoint, truncating anything written after it.
+
+    args:
+        api (API)          : the client used to fetch the records
+        model (class)      : the TSheetsObject class of the endpoint to export (i.e. Timesheet)
+        path (str)         : output file (ndjson, csv) or directory (columnar)
+        format (str)       : 'ndjson', 'csv' or 'columnar'
+        fields (list)      : optional projection. Only these fields are written, in this order.
+        compress (bool)    : gzip the ndjson/csv output (one gzip member per flush) or compress the npz parts
+        checkpoint (str)   : path of the checkpoint file. Default is `path` + '.checkpoint'.
+        buffer_pages (int) : number of pages buffered between two writes
+        shard_days (int)   : for timesheets, splits the start_date/end_date window in shards of this many days,
+                                exported one after the other
+
+    usage:
+        exporter = Exporter(tsclient, Timesheet, "timesheets.ndjson.gz", compress=True)
+        exporter.run(start_date="2014-01-01", end_date="2014-12-31")
+    """
+
+    formats = ("ndjson", "csv", "columnar")
+
+    def __init__(self, api, model, path, format="ndjson", fields=None, compress=False, checkpoint=None,
+                 buffer_pages=10, shard_days=None):
+        if format not in self.formats:
+            raise ValueError("unknown export format: {}".format(format))
+        if format == "columnar" and numpy is None:
+            raise ImportError("the columnar export format requires numpy")
+        self.api = api
+        self.model = model
+        self.path = path
+        self.format = format
+        self.fields = list(fields) if fields else None
+        self.compress = compress
+        self.checkpoint = checkpoint or path.rstrip(os.sep) + ".checkpoint"
+        self.buffer_pages = buffer_pages
+        self.shard_days = shard_days
+
+    def _shards(self, **kwargs):
+        if self.shard_days and self.model is Timesheet and kwargs.get("start_date") and kwargs.get("end_date"):
+            planner = TimesheetQueryPlanner(self.api, shard_days=self.shard_days)
+            return planner.shards(kwargs.pop("start_date"), kwargs.pop("end_date"), **kwargs)
+        return [kwargs]
+
+    def _load_state(self):
+        if os.path.exists(self.checkpoint):
+            with open(self.checkpoint) as f:
+                return json.load(f)
+        return {"shard": 0, "page": 0, "offset": 0, "part": 0, "rows": 0, "fields": self.fields}
+
+    def _save_state(self, state):
+        tmp = self.checkpoint + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.rename(tmp, self.checkpoint)
+
+    def run(self, **kwargs):
+        """
+        exports every record matching the filters in kwargs (see the list method of the model's endpoint),
+        resuming from the checkpoint if there is one, and returns the total number of records exported
+
+        raises:
+            TSheetsError
+            HTTPException
+        """
+        kwargs.pop("page", None)
+        state = self._load_state()
+        shards = self._shards(**kwargs)
+        output = None
+        if self.format == "columnar":
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+        else:
+            output = open(self.path, "r+b" if state["offset"] else "wb")
+            output.seek(state["offset"])
+            output.truncate()
+
+        try:
+            buffered = []
+            buffered_pages = 0
+            while state["shard"] < len(shards):
+                page = state["page"]
+                for page_json in self.api._iter_pages(self.model, page=page + 1, **shards[state["shard"]]):
+                    page += 1
+                    buffered.extend(self._project(self.api._result_rows(self.model, page_json)))
+                    buffered_pages += 1
+                    if buffered_pages >= self.buffer_pages:
+                        self._flush(output, buffered, state)
+                        state["page"] = page
+                        self._save_state(state)
+                        buffered = []
+                        buffered_pages = 0
+                self._flush(output, buffered, state)
+                state["shard"] += 1
+                state["page"] = 0
+                self._save_state(state)
+                buffered = []
+                buffered_pages = 0
+        finally:
+            if output is not None:
+                output.close()
+        if os.path.exists(self.checkpoint):
+            # no checkpoint is written when there is no shard to export
+            os.remove(self.checkpoint)
+        return state["rows"]
+
+    def _project(self, rows):
+        if not self.fields:
+            return list(rows)
+        return [OrderedDict((field, row.get(field)) for field in self.fields) for row in rows]
+
+    def _flush(self, output, rows, state):
+        """
+        writes the buffered rows and records the new size of the output in `state`
+        """
+        if not rows:
+            return
+        if self.format == "columnar":
+            self._write_part(rows, state)
+        else:
+            if self.format == "csv":
+                data = self._csv(rows, state)
+            else:
+                data = "".join(json.dumps(row, separators=(",", ":")) + "\n" for row in rows)
+                if not isinstance(data, bytes):
+                    data = data.encode("utf-8")
+            if self.compress:
+                # a complete gzip member per flush, so that the output can be truncated at any checkpoint
+                member = gzip.GzipFile(fileobj=output, mode="wb")
+                member.write(data)
+                member.close()
+            else:
+                output.write(data)
+            output.flush()
+            os.fsync(output.fileno())
+            state["offset"] = output.tell()
+        state["rows"] += len(rows)
+
+    @staticmethod
+    def _csv_value(value):
+        if value is None:
+            return ""
+        if isinstance(value, (dict, list)):
+            return json.dumps(value)
+        if isinstance(value, unicode):
+            return value.encode("utf-8")
+        return value
+
+    def _csv(self, rows, state):
+        buf = io.BytesIO()
+        writer = csv.writer(buf)
+        if not state.get("fields"):
+            state["fields"] = sorted(rows[0].keys())
+        if not state["offset"]:
+            writer.writerow(state["fields"])
+        for row in rows:
+            writer.writerow([self._csv_value(row.get(field)) for field in state["fields"]])
+        return buf.getvalue()
+
+    @staticmethod
+    def _column(values):
+        """
+        returns a NumPy array of the values of a field: numeric when every value is a number (missing values
+        being NaN), unicode strings otherwise
+        """
+        present = [v for v in values if v is not None]
+        if present and all(isinstance(v, bool) for v in present) and len(present) == len(values):
+            return numpy.array(values, dtype=bool)
+        if present and all(isinstance(v, (int, long, float)) and not isinstance(v, bool) for v in present):
+            if len(present) == len(values) and all(isinstance(v, (int, long)) for v in present):
+                return numpy.array(values, dtype=numpy.int64)
+            return numpy.array([numpy.nan if v is None else v for v in values], dtype=numpy.float64)
+        return numpy.array([u"" if v is None else json.dumps(v) if isinstance(v, (dict, list)) else unicode(v)
+                            for v in values])
+
+    def _write_part(self, rows, state):
+        fields = self.fields or sorted(set(k for row in rows for k in row))
+        columns = dict((field, self._column([row.get(field) for row in rows])) for field in fields)
+        part = os.path.join(self.path, "part-{:05d}.npz".format(state["part"]))
+        if self.compress:
+            numpy.savez_compressed(part, **columns)
+        else:
+            numpy.savez(part, **columns)
+        state["part"] += 1
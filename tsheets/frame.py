@@ -0,0 +1,194 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TimesheetFrame(object):
+    """
+    Columnar storage of timesheets, with vectorized filters and group-by sums. Requires NumPy.
+
+    Each column is a NumPy array with one entry per timesheet:
+        id (int64), user_id (int64), jobcode_id (int64), locked (int64), duration (int64, seconds),
+        date (datetime64[D]), on_the_clock (bool)
+
+    The users and jobcodes found in the supplemental data of the responses are kept in the `users` and `jobcodes`
+    tables (raw dicts indexed by id), which can be joined to the rows with `user_field` and `jobcode_field`.
+
+    usage:
+        frame = tsclient.timesheet_frame(start_date="2014-09-01", end_date="2014-09-30")
+        frame.hours_by("user_id", "jobcode_id")
+        # >>> {(1, 7): 12.5, (1, 11): 4.0, (2, 7): 38.25, ...}
+    """
+
+    int_columns = ("id", "user_id", "jobcode_id", "locked", "duration")
+    columns = int_columns + ("date", "on_the_clock")
+
+    def __init__(self, users=None, jobcodes=None, **columns):
+        if numpy is None:
+            raise ImportError("TimesheetFrame requires numpy")
+        for name in self.int_columns:
+            setattr(self, name, numpy.asarray(columns.get(name, []), dtype=numpy.int64))
+        self.date = numpy.asarray(columns.get("date", []), dtype="datetime64[D]")
+        self.on_the_clock = numpy.asarray(columns.get("on_the_clock", []), dtype=bool)
+        self.users = users if users is not None else {}
+        self.jobcodes = jobcodes if jobcodes is not None else {}
+
+    @classmethod
+    def from_pages(cls, pages):
+        """
+        builds a frame from an iterable of timesheets responses (i.e. `API._iter_pages(Timesheet, ...)`),
+        converting every page to arrays before the next one is fetched
+        """
+        if numpy is None:
+            raise ImportError("TimesheetFrame requires numpy")
+        chunks = dict((name, []) for name in cls.columns)
+        users = {}
+        jobcodes = {}
+        for page_json in pages:
+            rows = page_json.get("results", {}).get("timesheets", {})
+            rows = list(rows.itervalues() if hasattr(rows, "itervalues") else rows)
+            for name in cls.int_columns:
+                chunks[name].append(numpy.array([row.get(name) or 0 for row in rows], dtype=numpy.int64))
+            chunks["date"].append(numpy.array([row.get("date") or "NaT" for row in rows], dtype="datetime64[D]"))
+            chunks["on_the_clock"].append(numpy.array([bool(row.get("on_the_clock")) for row in rows], dtype=bool))
+            supplemental_data = page_json.get("supplemental_data") or {}
+            for u in supplemental_data.get("users", {}).itervalues():
+                users[u["id"]] = u
+            for j in supplemental_data.get("jobcodes", {}).itervalues():
+                jobcodes[j["id"]] = j
+        columns = dict((name, numpy.concatenate(chunk) if chunk else []) for name, chunk in chunks.items())
+        return cls(users=users, jobcodes=jobcodes, **columns)
+
+    def __len__(self):
+        return len(self.id)
+
+    def __repr__(self):
+        return "<TimesheetFrame: {} timesheets>".format(len(self))
+
+    @property
+    def hours(self):
+        """
+        returns the duration of every timesheet, in hours
+        """
+        return self.duration / 3600.0
+
+    @property
+    def week(self):
+        """
+        returns the first day (monday) of the week of every timesheet
+        """
+        days = self.date.astype(numpy.int64)
+        # 1970-01-01 is a thursday
+        return (days - (days + 3) % 7).astype("datetime64[D]")
+
+    def filter(self, mask):
+        """
+        returns a new frame with the rows where `mask` (boolean array) is True
+        """
+        columns = dict((name, getattr(self, name)[mask]) for name in self.columns)
+        return TimesheetFrame(users=self.users, jobcodes=self.jobcodes, **columns)
+
+    def where(self, user_ids=None, jobcode_ids=None, start_date=None, end_date=None, on_the_clock=None):
+        """
+        returns a new frame with the rows matching every given filter
+
+        args:
+            user_ids (list of int)    : only rows of these users
+            jobcode_ids (list of int) : only rows of these jobcodes
+            start_date (str)          : YYYY-MM-DD formatted date. only rows dated on or after this date
+            end_date (str)            : YYYY-MM-DD formatted date. only rows dated on or before this date
+            on_the_clock (bool)       : only rows with this on_the_clock value
+        """
+        mask = numpy.ones(len(self), dtype=bool)
+        if user_ids is not None:
+            mask &= numpy.in1d(self.user_id, list(user_ids))
+        if jobcode_ids is not None:
+            mask &= numpy.in1d(self.jobcode_id, list(jobcode_ids))
+        if start_date is not None:
+            mask &= self.date >= numpy.datetime64(start_date, "D")
+        if end_date is not None:
+            mask &= self.date <= numpy.datetime64(end_date, "D")
+        if on_the_clock is not None:
+            mask &= self.on_the_clock == bool(on_the_clock)
+        return self.filter(mask)
+
+    def _group(self, keys):
+        """
+        returns the unique key arrays of the given columns and the group index of every row
+        """
+        group_index = numpy.zeros(len(self), dtype=numpy.int64)
+        uniques = []
+        for key in keys:
+            values = self.week if key == "week" else getattr(self, key)
+            unique, inverse = numpy.unique(values, return_inverse=True)
+            uniques.append(unique)
+            group_index = group_index * len(unique) + inverse
+        groups, group_index = numpy.unique(group_index, return_inverse=True)
+        # decode the combined index of every group back to one index per key
+        key_indexes = []
+        for unique in reversed(uniques):
+            key_indexes.append(groups % len(unique))
+            groups = groups // len(unique)
+        key_indexes.reverse()
+        return [unique[index] for unique, index in zip(uniques, key_indexes)], group_index
+
+    def hours_by(self, *keys):
+        """
+        returns the total hours per group of rows sharing the same values of `keys`, which are column names or
+        'week'. Groups are indexed by the key value, or by a tuple of key values when several keys are given.
+        """
+        if not len(self):
+            return {}
+        key_values, group_index = self._group(keys)
+        totals = numpy.bincount(group_index, weights=self.duration) / 3600.0
+        key_values = [values.astype(object) if values.dtype.kind == "M" else values.tolist()
+                      for values in key_values]
+        if len(keys) == 1:
+            return dict(zip(key_values[0], totals.tolist()))
+        return dict(zip(zip(*key_values), totals.tolist()))
+
+    def hours_by_user(self):
+        return self.hours_by("user_id")
+
+    def hours_by_jobcode(self):
+        return self.hours_by("jobcode_id")
+
+    def hours_by_day(self):
+        return self.hours_by("date")
+
+    def hours_by_week(self):
+        return self.hours_by("week")
+
+    def _join(self, ids, table, field):
+        unique, inverse = numpy.unique(ids, return_inverse=True)
+        values = numpy.array([table.get(i, {}).get(field) for i in unique.tolist()], dtype=object)
+        return values[inverse]
+
+    def user_field(self, field):
+        """
+        returns the `field` of the user of every row, from the `users` table
+        """
+        return self._join(self.user_id, self.users, field)
+
+    def jobcode_field(self, field):
+        """
+        returns the `field` of the jobcode of every row, from the `jobcodes` table
+        """
+        return self._join(self.jobcode_id, self.jobcodes, field)
+
+    def grouped_hours(self):
+        """
+        returns the total hours per user and jobcode, following the totals of `API.grouped_timesheets`:
+        {
+            <user_id>: {"jobcodes": {<jobcode_id>: 0.0}, "summary": {"total_hours": 0.0}},
+            "summary": {"total_hours": 0.0}
+        }
+        """
+        result = {}
+        for (user_id, jobcode_id), hours in self.hours_by("user_id", "jobcode_id").items():
+            user_data = result.setdefault(user_id, {"jobcodes": {}, "summary": {"total_hours": 0.0}})
+            user_data["jobcodes"][jobcode_id] = hours
+            user_data["summary"]["total_hours"] += hours
+        result["summary"] = {"total_hours": float(self.duration.sum()) / 3600.0}
+        return result
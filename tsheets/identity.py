@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+from .models import _datetime
+
+
+class IdentityMap(object):
+    """
+    Hands out a single shared instance per (model, id), so that records repeated across responses (i.e. the
+    users and jobcodes of `supplemental_data`) are built once. A shared instance is updated in place when a row
+    with a newer `last_modified` arrives.
+
+    The map holds up to `max_entries` instances, the least recently used ones being dropped first, so that long
+    running jobs do not keep every record they have seen. A dropped instance stays valid for whoever holds it,
+    but is no longer shared with the records hydrated after it.
+
+    args:
+        max_entries (int) : maximum number of instances kept. None keeps every instance.
+
+    usage:
+        jobcode = tsclient.identity_map.hydrate(Jobcode, row, api=tsclient)
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._instances = OrderedDict()
+        # raw `last_modified` of the row each shared instance was last built or updated from
+        self._last_modified = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._instances)
+
+    def get(self, model, id):
+        """
+        returns the shared instance of `model` with the given id, or None
+        """
+        key = (model, int(id))
+        with self._lock:
+            instance = self._instances.pop(key, None)
+            if instance is not None:
+                # mark as most recently used
+                self._instances[key] = instance
+            return instance
+
+    def hydrate(self, model, row, api=None):
+        """
+        returns the shared instance of `model` for the raw `row`, building it on first sight and updating it when
+        `row` was modified after the shared instance
+        """
+        key = (model, int(row["id"]))
+        last_modified = row.get("last_modified")
+        with self._lock:
+            instance = self._instances.pop(key, None)
+            if instance is None:
+                instance = model(api=api, **row)
+                self._last_modified[key] = last_modified
+            elif (last_modified and last_modified != self._last_modified.get(key) and
+                    self._is_newer(_datetime(last_modified), instance.last_modified)):
+                instance._update(**row)
+                self._last_modified[key] = last_modified
+            # (re)inserted as the most recently used instance
+            self._instances[key] = instance
+            if self.max_entries is not None:
+                while len(self._instances) > self.max_entries:
+                    evicted, _ = self._instances.popitem(last=False)
+                    self._last_modified.pop(evicted, None)
+            return instance
+
+    @staticmethod
+    def _is_newer(last_modified, current):
+        if current is None:
+            return True
+        try:
+            return last_modified > current
+        except TypeError:
+            # i.e. comparing an aware datetime with an unparsed value
+            return False
+
+    def discard(self, model, id):
+        with self._lock:
+            self._instances.pop((model, int(id)), None)
+            self._last_modified.pop((model, int(id)), None)
+
+    def clear(self):
+        with self._lock:
+            self._instances.clear()
+            self._last_modified.clear()
@@ -0,0 +1,199 @@
+import bisect
+import threading
+import time
+
+
+class RequestEvent(object):
+    """
+    What happened to a single GET request of an `API` client, delivered to the listeners of its `Instrumentation`
+
+    Attributes:
+        endpoint (str)         : i.e. 'timesheets'
+        params (dict)          : the query string parameters of the request
+        page (int)             : the requested page, or None
+        status (int)           : status code of the last response. None for cache hits and failed requests.
+        bytes (int)            : size of the response body
+        latency (float)        : seconds spent sending the request and waiting for the response, retries and
+                                    rate limiting included
+        decode_time (float)    : seconds spent decoding the JSON response
+        hydration_time (float) : seconds the caller spent on the page before asking for the next one (i.e.
+                                    building the models, for the list methods). None for pages fetched outside
+                                    of a paginated walk.
+        retries (int)          : number of times the request was retried
+        cache_hit (bool)       : True when the response came from the client's cache
+        coalesced (bool)       : True when the response was shared with an identical request in flight in
+                                    another thread. Its latency is then the time spent waiting for it.
+        error (str)            : the exception raised by the request, if any
+    """
+
+    __slots__ = ("endpoint", "params", "page", "status", "bytes", "latency", "decode_time", "hydration_time",
+                 "retries", "cache_hit", "coalesced", "error")
+
+    def __init__(self, endpoint, params):
+        self.endpoint = endpoint
+        # a copy, since the parameters of a paginated walk are updated from page to page
+        self.params = dict(params or {})
+        self.page = self.params.get("page")
+        self.status = None
+        self.bytes = 0
+        self.latency = 0.0
+        self.decode_time = 0.0
+        self.hydration_time = None
+        self.retries = 0
+        self.cache_hit = False
+        self.coalesced = False
+        self.error = None
+
+    def __repr__(self):
+        return "<RequestEvent {} page {}: {} in {:.3f}s>".format(self.endpoint, self.page,
+                                                                  "cached" if self.cache_hit else self.status,
+                                                                  self.latency)
+
+
+class EndpointStats(object):
+    """
+    A listener aggregating request events per endpoint: counters, total times and a latency histogram.
+
+    args:
+        buckets (tuple) : upper bounds, in seconds, of the latency histogram buckets. Latencies above the last
+                             bound are counted in an extra bucket.
+    """
+
+    default_buckets = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or self.default_buckets)
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            stats = self._endpoints.get(event.endpoint)
+            if stats is None:
+                stats = self._endpoints[event.endpoint] = {
+                    "requests": 0, "cache_hits": 0, "coalesced": 0, "errors": 0, "retries": 0, "bytes": 0,
+                    "latency": 0.0, "decode_time": 0.0, "hydration_time": 0.0,
+                    "histogram": [0] * (len(self.buckets) + 1),
+                }
+            stats["requests"] += 1
+            stats["retries"] += event.retries
+            stats["bytes"] += event.bytes
+            stats["decode_time"] += event.decode_time
+            stats["hydration_time"] += event.hydration_time or 0.0
+            if event.error is not None:
+                stats["errors"] += 1
+            if event.coalesced:
+                stats["coalesced"] += 1
+            if event.cache_hit:
+                stats["cache_hits"] += 1
+            else:
+                stats["latency"] += event.latency
+                stats["histogram"][bisect.bisect_left(self.buckets, event.latency)] += 1
+
+    def summary(self):
+        """
+        returns the counters of every endpoint, indexed by endpoint name
+        """
+        with self._lock:
+            return dict((endpoint, dict(stats, histogram=list(stats["histogram"])))
+                        for endpoint, stats in self._endpoints.iteritems())
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+
+
+class Instrumentation(object):
+    """
+    Delivers the `RequestEvent` of every GET request of an `API` client to pluggable listeners, and aggregates
+    them per endpoint in `stats`. A client without instrumentation (the default) skips all of it.
+
+    A listener is any callable taking a RequestEvent. Listeners are called in the thread which performed or
+    consumed the request, so they must be thread-safe; an exception raised by a listener propagates to the
+    caller.
+
+    usage:
+        tsclient = api.API(token, instrumentation=Instrumentation())
+        tsclient.instrumentation.add_listener(lambda event: log.debug("%r", event))
+        ...
+        print tsclient.instrumentation.stats.summary()
+    """
+
+    def __init__(self, listeners=None, stats=None):
+        self.stats = stats if stats is not None else EndpointStats()
+        self._listeners = (self.stats,) + tuple(listeners or ())
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        with self._lock:
+            self._listeners += (listener,)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            self._listeners = tuple(l for l in self._listeners if l is not listener)
+
+    def emit(self, event):
+        # the listeners tuple is replaced, never modified, so it can be iterated without the lock
+        for listener in self._listeners:
+            listener(event)
+
+
+class Profile(object):
+    """
+    A listener collecting the request events of a block of code, to report where its time went.
+    See `API.profile`.
+
+    Network, decode and hydration times are summed over every request: with concurrent fetches, they can exceed
+    the wall time of the block.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.started = None
+        self.wall_time = None
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def start(self):
+        self.started = time.time()
+
+    def stop(self):
+        self.wall_time = time.time() - self.started
+
+    def summary(self):
+        """
+        returns the totals of the profiled block
+        """
+        with self._lock:
+            events = list(self.events)
+        network = sum(e.latency for e in events if not e.cache_hit)
+        decode = sum(e.decode_time for e in events)
+        hydration = sum(e.hydration_time or 0.0 for e in events)
+        wall = self.wall_time if self.wall_time is not None else time.time() - self.started
+        return {
+            "wall_time": wall,
+            "requests": len(events),
+            "cache_hits": sum(1 for e in events if e.cache_hit),
+            "retries": sum(e.retries for e in events),
+            "bytes": sum(e.bytes for e in events),
+            "network_time": network,
+            "decode_time": decode,
+            "hydration_time": hydration,
+            # the time which is not accounted for by requests (i.e. grouping, or hydration of single pages)
+            "other_time": max(wall - network - decode - hydration, 0.0),
+        }
+
+    def report(self):
+        """
+        returns a human readable summary of the profiled block
+        """
+        s = self.summary()
+        lines = ["{requests} requests ({cache_hits} cached, {retries} retries, {bytes} bytes) "
+                 "in {wall_time:.3f}s".format(**s)]
+        for name in ("network_time", "decode_time", "hydration_time", "other_time"):
+            share = s[name] / s["wall_time"] * 100 if s["wall_time"] else 0.0
+            lines.append("  {:<15} {:>9.3f}s {:>6.1f}%".format(name.replace("_time", ""), s[name], share))
+        return "\n".join(lines)
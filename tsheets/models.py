@@ -1,14 +1,203 @@
 import datetime
 
 
+class _FixedOffset(datetime.tzinfo):
+    """
+    a fixed UTC offset, as found in ISO8601 date/times
+    """
+
+    def __init__(self, minutes):
+        self._minutes = minutes
+        self._offset = datetime.timedelta(minutes=minutes)
+        self._name = "{}{:02d}:{:02d}".format("-" if minutes < 0 else "+", abs(minutes) // 60, abs(minutes) % 60)
+
+    def utcoffset(self, dt):
+        return self._offset
+
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+    def tzname(self, dt):
+        return self._name
+
+    def __getinitargs__(self):
+        return (self._minutes,)
+
+    def __repr__(self):
+        return "<UTC{}>".format(self._name)
+
+
+_offsets = {}
+
+
+def _tz(minutes):
+    tz = _offsets.get(minutes)
+    if tz is None:
+        tz = _offsets.setdefault(minutes, _FixedOffset(minutes))
+    return tz
+
+
+def _int(value):
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _float(value):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _date(value):
+    """
+    converts a YYYY-MM-DD formatted date to a date object. Empty and zero (0000-00-00) dates are returned as None.
+    """
+    if isinstance(value, datetime.date):
+        return value
+    if not value or value.startswith("0000"):
+        return None
+    try:
+        return datetime.date(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+    except (TypeError, ValueError):
+        return value
+
+
+def _datetime(value):
+    """
+    converts an ISO8601 formatted date/time (i.e. 2004-02-12T15:19:21+00:00, or 2004-02-12T15:19:21.123-07:00)
+    to a datetime object, aware of its UTC offset. Empty and zero (0000-00-00...) date/times are returned as None.
+    """
+    if isinstance(value, datetime.datetime):
+        return value
+    if not value or value.startswith("0000"):
+        return None
+    try:
+        tz = None
+        microsecond = 0
+        offset = value[19:]
+        if offset[:1] == ".":
+            end = 1
+            while end < len(offset) and offset[end].isdigit():
+                end += 1
+            microsecond = int(offset[1:end][:6].ljust(6, "0"))
+            offset = offset[end:]
+        if offset == "Z":
+            tz = _tz(0)
+        elif offset:
+            if offset[0] not in "+-":
+                raise ValueError(value)
+            digits = offset[1:].replace(":", "")
+            minutes = int(digits[0:2]) * 60 + int(digits[2:4] or 0)
+            tz = _tz(-minutes if offset[0] == "-" else minutes)
+        return datetime.datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                                 int(value[11:13]), int(value[14:16]), int(value[17:19]), microsecond, tz)
+    except (TypeError, ValueError, IndexError):
+        return value
+
+
+def _raw(value):
+    return value
+
+
 class BaseTSheetObject(object):
-    id = None
+    """
+    Base class of the TSheets objects.
+
+    Every subclass declares its schema in `_fields` as (name, converter) pairs, which are stored in `__slots__`
+    and converted once, at construction. Keys which are not part of the schema are kept in the `_extra`
+    mapping and remain readable as attributes.
+    """
+
+    __slots__ = ("api", "_extra")
+    _fields = ()
     _endpoint_name = None
     _result_object_key = None
 
-    def __init__(self, **kwargs):
-        for k, v in kwargs.items():
-            setattr(self, k, v)
+    def __init__(self, api=None, **kwargs):
+        self.api = api
+        for name, convert in self._fields:
+            value = kwargs.pop(name, None)
+            setattr(self, name, None if value is None else convert(value))
+        self._extra = kwargs
+
+    def _update(self, **kwargs):
+        """
+        updates this object in place with the (raw) values in kwargs
+        """
+        for name, convert in self._fields:
+            if name in kwargs:
+                value = kwargs.pop(name)
+                setattr(self, name, None if value is None else convert(value))
+        self._extra.update(kwargs)
+
+    def __getattr__(self, name):
+        # only called when `name` is neither a field nor a class attribute
+        try:
+            return object.__getattribute__(self, "_extra")[name]
+        except (AttributeError, KeyError):
+            raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+    def __getstate__(self):
+        state = dict((name, getattr(self, name)) for name, _ in self._fields)
+        state["_extra"] = self._extra
+        return state
+
+    def __setstate__(self, state):
+        self.api = None
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+class TSObjectList(list):
+    """
+    A list of TSheets objects which also carries the `supplemental_data` of the responses it was built from:
+    {"<key>": {<id>: <object or raw dict>}}, users and jobcodes being shared User and Jobcode instances.
+    The raw supplemental data of the responses is only indexed (and its objects built) when `supplemental_data`
+    is first read.
+    """
+
+    def __init__(self, *args):
+        super(TSObjectList, self).__init__(*args)
+        self._supplemental_data = {}
+        # (hydrate, raw supplemental data) pairs of the responses not indexed yet
+        self._pending_supplemental = []
+
+    def _add_supplemental_data(self, supplemental_data, hydrate):
+        """
+        keeps the raw `supplemental_data` of a response, `hydrate(key, record)` returning the object of a record
+        """
+        if supplemental_data:
+            self._pending_supplemental.append((hydrate, supplemental_data))
+
+    @property
+    def supplemental_data(self):
+        pending, self._pending_supplemental = self._pending_supplemental, []
+        for hydrate, supplemental_data in pending:
+            for key, records in supplemental_data.iteritems():
+                records = records.itervalues() if hasattr(records, 'itervalues') else records
+                index = self._supplemental_data.setdefault(key, {})
+                for record in records:
+                    index[record['id']] = hydrate(key, record)
+        return self._supplemental_data
+
+    @supplemental_data.setter
+    def supplemental_data(self, value):
+        self._supplemental_data = value
+        self._pending_supplemental = []
+
+    def __getstate__(self):
+        return {"_supplemental_data": self.supplemental_data, "_pending_supplemental": []}
+
+
+def _slots(fields):
+    return tuple(name for name, _ in fields)
 
 
 class User(BaseTSheetObject):
@@ -31,18 +220,18 @@ class User(BaseTSheetObject):
         employee_number (int) : Unique number associated with this user. For your reference only.
         
         mobile_number (str): Mobile phone number associated with this user.
-        hire_date (str)    : YYYY-MM-DD formatted date upon which this user was hired.
-        term_date (str)    : YYYY-MM-DD formatted date upon which this user's employment was terminated.
-        last_active (str)  : (ISO8601 format). Read-only. Date/time when this user last performed any action
+        hire_date (date)   : YYYY-MM-DD formatted date upon which this user was hired.
+        term_date (date)   : YYYY-MM-DD formatted date upon which this user's employment was terminated.
+        last_active (datetime) : (ISO8601 format). Read-only. Date/time when this user last performed any action
                                 within TSheets (i.e. 2004-02-12T15:19:21+00:00).
         active (bool)      : If False, this user is considered archived.
-        approved_to (str)  : YYYY-MM-DD formatted date indicating the latest date 
+        approved_to (date) : YYYY-MM-DD formatted date indicating the latest date 
                                 this user has had timesheets approved to (if approvals addon is installed).
-        submitted_to (str) : YYYY-MM-DD formatted date indicating the latest date this user has 
+        submitted_to (date) : YYYY-MM-DD formatted date indicating the latest date this user has 
                                 submitted timesheets up to (if approvals addon is installed).
-        last_modified (str) :(ISO8601 format). Read-only. Date/time when this user was last modified
+        last_modified (datetime) : (ISO8601 format). Read-only. Date/time when this user was last modified
                                 (i.e. 2004-02-12T15:19:21+00:00).
-        created (str)       : String (ISO8601 format). Read-only. Date/time when this user was created
+        created (datetime)  : (ISO8601 format). Read-only. Date/time when this user was created
                                 (i.e. 2004-02-12T15:19:21+00:00).
         permissions (dict)  : Permissions with a True/False value for each that apply to this user.
         
@@ -62,6 +251,40 @@ class User(BaseTSheetObject):
     see: http://developers.tsheets.com/docs/api/users/user-object
     """
 
+    _fields = (
+        ("id", _int),
+        ("first_name", _raw),
+        ("last_name", _raw),
+        ("display_name", _raw),
+        ("group_id", _int),
+        ("active", _raw),
+        ("employee_number", _int),
+        ("salaried", _raw),
+        ("exempt", _raw),
+        ("username", _raw),
+        ("email", _raw),
+        ("email_verified", _raw),
+        ("payroll_id", _raw),
+        ("hire_date", _date),
+        ("term_date", _date),
+        ("last_modified", _datetime),
+        ("last_active", _datetime),
+        ("created", _datetime),
+        ("client_url", _raw),
+        ("company_name", _raw),
+        ("profile_image_url", _raw),
+        ("mobile_number", _raw),
+        ("pto_balances", _raw),
+        ("submitted_to", _date),
+        ("approved_to", _date),
+        ("manager_of_group_ids", _raw),
+        ("require_password_change", _raw),
+        ("pay_rate", _float),
+        ("pay_interval", _raw),
+        ("permissions", _raw),
+        ("customfields", _raw),
+    )
+    __slots__ = _slots(_fields)
     _endpoint_name = "users"
     _result_object_key = "users"
 
@@ -91,6 +314,7 @@ class User(BaseTSheetObject):
     def timesheets(self, **kwargs):
         """
         returns a list of timesheets for this user.
+        When the client has a `store`, supported filters are answered from it after a delta sync.
         
         args:
             see: `API.list_timesheets` method
@@ -99,9 +323,14 @@ class User(BaseTSheetObject):
            TsheetsError
            HTTPException
         """
-        if not hasattr(self, 'api'): return []
+        if not self.api: return []
 
         kwargs.update({"user_ids":self.id})
+        store = getattr(self.api, 'store', None)
+        if store is not None and set(kwargs) <= store.timesheet_filters:
+            # answer locally after a delta sync
+            store.sync(Timesheet)
+            return store.timesheets(**kwargs)
         return self.api.list_timesheets(**kwargs)
 
     def jobcodes(self, exclude_global=True, **kwargs):
@@ -129,7 +358,7 @@ class User(BaseTSheetObject):
         if assignments.get('supplemental_data'):
             jcodes = assignments.get('supplemental_data').get('jobcodes')
             if jcodes:
-                result = [Jobcode(api=self.api, **j) for j in jcodes.values() if not j['has_children']]
+                result = [self.api._hydrate(Jobcode, j) for j in jcodes.itervalues() if not j['has_children']]
                 if excl:
                     result = [j for j in result if j.assigned_to_all ]
         return result
@@ -166,6 +395,7 @@ class CurrentUser(User):
     """
     A subclass of User which is used to represent the user associated with the current access token
     """
+    __slots__ = ()
     _endpoint_name = "current_user"
     _result_object_key = "users"
 
@@ -199,9 +429,9 @@ class Jobcode(BaseTSheetObject):
         has_children (bool)   : Read-only. If True, there are jobcodes that exist underneath this one, so this jobcode
                                    should be treated as a container or folder with children jobcodes underneath it.
         assigned_to_all (bool): Indicates whether this jobcode is assigned to all employees or not.
-        last_modified (str)   : (ISO8601 format). Read-only. Date/time when this jobcode was last modified
+        last_modified (datetime) : (ISO8601 format). Read-only. Date/time when this jobcode was last modified
                                    (i.e. 2004-02-12T15:19:21+00:00).
-        created (str) :       : String (ISO8601 format). Read-only. Date/time when this jobcode was created
+        created (datetime)    : (ISO8601 format). Read-only. Date/time when this jobcode was created
                                    (i.e. 2004-02-12T15:19:21+00:00).
                                    
         filtered_customfielditems (dict) : Displays which customfielditems should be displayed when this jobcode
@@ -213,6 +443,24 @@ class Jobcode(BaseTSheetObject):
     see: http://developers.tsheets.com/docs/api/jobcodes/jobcode-object
     """
 
+    _fields = (
+        ("id", _int),
+        ("parent_id", _int),
+        ("assigned_to_all", _raw),
+        ("billable", _raw),
+        ("active", _raw),
+        ("type", _raw),
+        ("has_children", _raw),
+        ("billable_rate", _float),
+        ("short_code", _raw),
+        ("name", _raw),
+        ("last_modified", _datetime),
+        ("created", _datetime),
+        ("filtered_customfielditems", _raw),
+        ("required_customfields", _raw),
+        ("locations", _raw),
+    )
+    __slots__ = _slots(_fields)
     _endpoint_name = "jobcodes"
     _result_object_key = "jobcodes"
 
@@ -232,14 +480,23 @@ class JobcodeAssignment(BaseTSheetObject):
         jobcode_id (int): Id of the jobcode that this assignment pertains to.
         active (bool)   : Whether or not this assignment is 'active'. If false, then the assignment has been deleted.
                              true means it is in force.  
-        created (str)   : (ISO8601 format). Read-only. Date/time when this jobcode assignment was created
+        created (datetime) : (ISO8601 format). Read-only. Date/time when this jobcode assignment was created
                              (i.e. 2004-02-12T15:19:21+00:00).                             
-        last_modified (str) : (ISO8601 format). Read-only. Date/time when this jobcode assignment was last modified
+        last_modified (datetime) : (ISO8601 format). Read-only. Date/time when this jobcode assignment was last modified
                              (i.e. 2004-02-12T15:19:21+00:00).
     
     see: http://developers.tsheets.com/docs/api/jobcode_assignments/jobcode-assignment-object
     """
 
+    _fields = (
+        ("id", _int),
+        ("user_id", _int),
+        ("jobcode_id", _int),
+        ("active", _raw),
+        ("last_modified", _datetime),
+        ("created", _datetime),
+    )
+    __slots__ = _slots(_fields)
     _endpoint_name = "jobcode_assignments"
     _result_object_key = "jobcode_assignments"
 
@@ -260,9 +517,9 @@ class Timesheet(BaseTSheetObject):
         notes (str)        : Notes associated with the timesheet.
         customfields (str) : Only present if the Custom Fields Add-On is installed. This will be a key => value
                                 array of customfield ids and customfield items that are associated with the timesheet.
-        created (str)      : (ISO8601 format). Read-only. Date/time when this object was created
+        created (datetime) : (ISO8601 format). Read-only. Date/time when this object was created
                                 (i.e. 2004-02-12T15:19:21+00:00).
-        last_modified (str): (ISO8601 format). Read-only. Date/time when this object was last modified
+        last_modified (datetime) : (ISO8601 format). Read-only. Date/time when this object was last modified
                                 (i.e. 2004-02-12T15:19:21+00:00).
         type (str)         : Either 'regular' or 'manual'. Regular timesheets have a start/end time
                                 (duration is calculated by TSheets). Manual timesheets have a date and a duration
@@ -272,22 +529,44 @@ class Timesheet(BaseTSheetObject):
                                 Manual timesheets will always have this property set as false.
 
         **Regular Timesheets**
-            start (str)    : (ISO8601 format). Date/time that represents the start time of this timesheet
+            start (datetime) : (ISO8601 format). Date/time that represents the start time of this timesheet
                                 (i.e. 2004-02-12T15:19:21+00:00).
-            end (str)      : (ISO8601 format). Date/time that represents the end time of this timesheet
-                                (i.e. 2004-02-12T15:19:21+00:00). Enter an empty string to make the timesheet active.
-            date (str)     : Read-only. YYYY-MM-DD formatted date. The timesheet's date.
+            end (datetime) : (ISO8601 format). Date/time that represents the end time of this timesheet
+                                (i.e. 2004-02-12T15:19:21+00:00). None while the timesheet is active.
+            date (date)    : Read-only. YYYY-MM-DD formatted date. The timesheet's date.
             duration (int) : Read-only. The total number of seconds recorded for this timesheet.
 
         **Manual Timesheets**
-            start (str)    : Not applicable. Will always be an empty string.
-            end (str)      : Not applicable. Will always be an empty string.
-            date (str)     : YYYY-MM-DD formatted date. The timesheet's date.
+            start (datetime) : Not applicable. Will always be None.
+            end (datetime) : Not applicable. Will always be None.
+            date (date)    : YYYY-MM-DD formatted date. The timesheet's date.
             duration (int) : The total number of seconds recorded for this timesheet.
     
     see : http://developers.tsheets.com/docs/api/jobcode_assignments/jobcode-assignment-object
     """
 
+    _fields = (
+        ("id", _int),
+        ("user_id", _int),
+        ("jobcode_id", _int),
+        ("start", _datetime),
+        ("end", _datetime),
+        ("duration", _int),
+        ("date", _date),
+        ("tz", _raw),
+        ("tz_str", _raw),
+        ("type", _raw),
+        ("location", _raw),
+        ("on_the_clock", _raw),
+        ("locked", _int),
+        ("notes", _raw),
+        ("customfields", _raw),
+        ("attached_files", _raw),
+        ("created_by_user_id", _int),
+        ("last_modified", _datetime),
+        ("created", _datetime),
+    )
+    __slots__ = _slots(_fields)
     _endpoint_name = "timesheets"
     _result_object_key = "timesheets"
 
@@ -306,9 +585,7 @@ class Timesheet(BaseTSheetObject):
         """
         returns this timesheet's date as Date object
         """
-        if not self.date:
-            return None
-        return datetime.datetime.strptime(self.date, '%Y-%m-%d').date()
+        return self.date
 
     def __repr__(self):
         return "<Timesheet #%s: %s (%.2f hrs) >" % (self.id, self.date, self.tshours)
@@ -322,8 +599,8 @@ class PayrollReport(BaseTSheetObject):
     Attributes:
         user_id (int)           : id of the user associated with the payroll report
         client_id (str)         : id of the client
-        start_date (str)        : YYYY-MM-DD start_date of the payroll reporting timeframe
-        end_date (str)          : YYYY-MM-DD end_date of the payroll reporting timeframe
+        start_date (date)       : YYYY-MM-DD start_date of the payroll reporting timeframe
+        end_date (date)         : YYYY-MM-DD end_date of the payroll reporting timeframe
         total_re_seconds (int)  : regular time, in seconds
         total_ot_seconds (int)  : overtime time, in seconds
         total_dt_seconds (int)  : doubletime time, in seconds
@@ -334,11 +611,102 @@ class PayrollReport(BaseTSheetObject):
     see: http://developers.tsheets.com/docs/api/reports/payroll-report
     """
 
+    _fields = (
+        ("id", _int),
+        ("user_id", _int),
+        ("client_id", _raw),
+        ("start_date", _date),
+        ("end_date", _date),
+        ("total_re_seconds", _int),
+        ("total_ot_seconds", _int),
+        ("total_dt_seconds", _int),
+        ("total_pto_seconds", _int),
+        ("total_work_seconds", _int),
+        ("pto_seconds", _raw),
+    )
+    __slots__ = _slots(_fields)
     _endpoint_name = "reports/payroll"
     _result_object_key = "payroll_report"
 
+    _summed_fields = ("total_re_seconds", "total_ot_seconds", "total_dt_seconds", "total_pto_seconds",
+                      "total_work_seconds")
+
+    def merge(self, other):
+        """
+        adds the time of `other`, a report of the same user for another timeframe, to this report and extends
+        this report's timeframe to cover both. Returns this report.
+        """
+        for name in self._summed_fields:
+            setattr(self, name, (getattr(self, name) or 0) + (getattr(other, name) or 0))
+        pto_seconds = dict(self.pto_seconds) if isinstance(self.pto_seconds, dict) else {}
+        if isinstance(other.pto_seconds, dict):
+            for code, seconds in other.pto_seconds.items():
+                pto_seconds[code] = pto_seconds.get(code, 0) + seconds
+        self.pto_seconds = pto_seconds
+        if other.start_date and (not self.start_date or other.start_date < self.start_date):
+            self.start_date = other.start_date
+        if other.end_date and (not self.end_date or other.end_date > self.end_date):
+            self.end_date = other.end_date
+        return self
+
     def __str__(self):
         return self.__repr__()
 
     def __repr__(self):
         return "<Payroll Report for user #{} {}-{}>".format(self.user_id, self.start_date, self.end_date)
+
+
+class LazyRecord(object):
+    """
+    A read-only view over a raw result row of `model`, which converts a field only when it is read and builds the
+    full `model` instance only when it is needed (i.e. to call one of its methods, or with `materialize`).
+    Properties of the model, such as `Timesheet.tshours`, are evaluated against the view itself.
+
+    usage:
+        for ts in tsclient.iter_timesheets(start_date="2014-01-01", end_date="2014-12-31", lazy=True):
+            hours[ts.jobcode_id] += ts.duration
+    """
+
+    __slots__ = ("_model", "_row", "_api", "_instance")
+    _converters = {}
+
+    def __init__(self, model, row, api=None):
+        self._model = model
+        self._row = row
+        self._api = api
+        self._instance = None
+
+    @classmethod
+    def _converters_of(cls, model):
+        converters = cls._converters.get(model)
+        if converters is None:
+            converters = cls._converters.setdefault(model, dict(model._fields))
+        return converters
+
+    def materialize(self):
+        """
+        returns the full `model` instance of this row, building it on first use
+        """
+        if self._instance is None:
+            self._instance = self._model(api=self._api, **self._row)
+        return self._instance
+
+    def __getattr__(self, name):
+        # only called for names which are not slots of the view
+        if self._instance is not None:
+            return getattr(self._instance, name)
+        if name == "api":
+            return self._api
+        convert = self._converters_of(self._model).get(name)
+        if convert is not None:
+            value = self._row.get(name)
+            return None if value is None else convert(value)
+        if name in self._row:
+            return self._row[name]
+        attribute = getattr(self._model, name, None)
+        if isinstance(attribute, property):
+            return attribute.fget(self)
+        return getattr(self.materialize(), name)
+
+    def __repr__(self):
+        return repr(self.materialize())
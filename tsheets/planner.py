@@ -0,0 +1,133 @@
+import datetime
+from collections import deque
+from .models import Timesheet
+
+
+DATE_FORMAT = '%Y-%m-%d'
+
+
+class TimesheetQueryPlanner(object):
+    """
+    Splits a wide `list_timesheets` query into independent shards (date windows, optionally crossed with chunks of
+    `user_ids`/`group_ids`), fetches the shards in parallel in the client's thread pool and merges the results,
+    dropping duplicate timesheet ids.
+
+    The size of the date windows adapts while the query runs: every completed shard reports how many pages it
+    needed, and the windows planned next are resized so that each shard needs about `target_pages` pages.
+
+    args:
+        api (API)            : the client used to fetch the shards
+        shard_days (int)     : initial size, in days, of a date window
+        min_shard_days (int) : smallest date window the planner will use
+        max_shard_days (int) : largest date window the planner will use
+        target_pages (int)   : number of pages a single shard should ideally take
+        id_chunk_size (int)  : when set, `user_ids` and `group_ids` are split in chunks of this many ids, each chunk
+                                  being fetched as a separated shard
+    """
+
+    def __init__(self, api, shard_days=7, min_shard_days=1, max_shard_days=92, target_pages=4, id_chunk_size=None):
+        self.api = api
+        self.shard_days = shard_days
+        self.min_shard_days = min_shard_days
+        self.max_shard_days = max_shard_days
+        self.target_pages = target_pages
+        self.id_chunk_size = id_chunk_size
+
+    @staticmethod
+    def _parse_date(value):
+        if isinstance(value, datetime.date):
+            return value
+        return datetime.datetime.strptime(value, DATE_FORMAT).date()
+
+    def _id_chunks(self, **kwargs):
+        """
+        returns a list of filter dicts, one per chunk of `user_ids`/`group_ids`
+        """
+        chunks = [{}]
+        for key in ('user_ids', 'group_ids'):
+            if not kwargs.get(key):
+                continue
+            ids = [i.strip() for i in str(kwargs[key]).split(",") if i.strip()]
+            size = self.id_chunk_size or len(ids)
+            id_chunks = [",".join(ids[i:i + size]) for i in range(0, len(ids), size)]
+            chunks = [dict(chunk, **{key: id_chunk}) for chunk in chunks for id_chunk in id_chunks]
+        return chunks
+
+    def _adapt(self, days, pages):
+        """
+        returns the window size which should make a shard take about `target_pages` pages, given that a window
+        of `days` days took `pages` pages
+        """
+        shard_days = int(days * self.target_pages / float(max(pages, 1)))
+        return max(self.min_shard_days, min(self.max_shard_days, shard_days))
+
+    def _fetch_shard(self, params):
+        """
+        fetches every page of a single shard, serially, and returns the raw timesheet rows and the number of pages
+        """
+        rows = []
+        pages = 0
+        for page_json in self.api._iter_pages(Timesheet, prefetch=0, **params):
+            rows.extend(self.api._result_rows(Timesheet, page_json))
+            pages += 1
+        return rows, pages
+
+    def shards(self, start_date, end_date, **kwargs):
+        """
+        returns the list of query parameters (dicts) of the shards for the given window, using fixed
+        `shard_days` windows
+        """
+        start = self._parse_date(start_date)
+        end = self._parse_date(end_date)
+        filters = dict((k, v) for k, v in kwargs.items() if k not in ('user_ids', 'group_ids', 'page'))
+        result = []
+        while start <= end:
+            window_end = min(start + datetime.timedelta(days=self.shard_days - 1), end)
+            for chunk in self._id_chunks(**kwargs):
+                params = dict(filters, start_date=start.strftime(DATE_FORMAT),
+                              end_date=window_end.strftime(DATE_FORMAT))
+                params.update(chunk)
+                result.append(params)
+            start = window_end + datetime.timedelta(days=1)
+        return result
+
+    def run(self, start_date, end_date, **kwargs):
+        """
+        fetches every timesheet from `start_date` to `end_date` matching the filters in kwargs
+        (see `API.list_timesheets`) and returns them as a list of Timesheet objects, ordered by shard.
+        """
+        start = self._parse_date(start_date)
+        end = self._parse_date(end_date)
+        filters = dict((k, v) for k, v in kwargs.items()
+                       if k not in ('user_ids', 'group_ids', 'page', 'prefetch'))
+        chunks = self._id_chunks(**kwargs)
+        pool = self.api._get_pool()
+        workers = max(self.api._max_workers, 1)
+        shard_days = self.shard_days
+
+        pending = deque()
+        seen = set()
+        result = []
+        cursor = start
+
+        while cursor <= end or pending:
+            while cursor <= end and len(pending) < workers:
+                window_end = min(cursor + datetime.timedelta(days=shard_days - 1), end)
+                days = (window_end - cursor).days + 1
+                for chunk in chunks:
+                    params = dict(filters, start_date=cursor.strftime(DATE_FORMAT),
+                                  end_date=window_end.strftime(DATE_FORMAT))
+                    params.update(chunk)
+                    pending.append((days, pool.apply_async(self._fetch_shard, (params,))))
+                cursor = window_end + datetime.timedelta(days=1)
+
+            days, async_result = pending.popleft()
+            rows, pages = async_result.get()
+            shard_days = self._adapt(days, pages)
+
+            for row in rows:
+                if row['id'] in seen:
+                    continue
+                seen.add(row['id'])
+                result.append(Timesheet(api=self.api, **row))
+        return result
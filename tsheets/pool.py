@@ -0,0 +1,232 @@
+import threading
+import time
+from collections import deque
+
+from requests.adapters import HTTPAdapter
+from .api import API
+from .scheduler import RequestScheduler
+
+
+class Task(object):
+    """
+    The pending result of a function submitted to a `ClientPool`
+    """
+
+    def __init__(self, token, fn, args, kwargs):
+        self.token = token
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+
+    def _run(self, client):
+        try:
+            self._result = self.fn(client, *self.args, **self.kwargs)
+        except Exception as error:
+            self._error = error
+        finally:
+            self._done.set()
+
+    def ready(self):
+        return self._done.is_set()
+
+    def get(self, timeout=None):
+        """
+        waits for the function to complete and returns its result, or raises its exception
+
+        raises:
+            RuntimeError : when the result is not available after `timeout` seconds
+        """
+        if not self._done.wait(timeout):
+            raise RuntimeError("task not completed after {} seconds".format(timeout))
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class _Tenant(object):
+
+    __slots__ = ("client", "tasks", "running", "last_used")
+
+    def __init__(self, client):
+        self.client = client
+        self.tasks = deque()
+        self.running = 0
+        self.last_used = time.time()
+
+
+class ClientPool(object):
+    """
+    Runs work for many TSheets companies (one access token each) on a fixed set of worker threads.
+
+    Every token gets its own `API` client, created on first use and evicted after `idle_timeout` seconds without
+    work. All clients share one HTTP connection pool and a global rate limit and concurrency cap, on top of the
+    rate limit and concurrency cap of each token. Workers pick the tenants with pending work in round-robin
+    order, running at most `max_tasks_per_token` tasks of a tenant at a time, so that a tenant with a long
+    queue cannot starve the others.
+
+    args:
+        workers (int)             : number of worker threads
+        rate (float)              : requests per second of each token
+        burst (int)               : maximum number of requests of a token sent back to back
+        max_in_flight (int)       : maximum number of concurrent requests of each token
+        global_rate (float)       : requests per second of all the tokens together. None disables this limit.
+        global_burst (int)        : maximum number of requests of all the tokens sent back to back
+        global_max_in_flight (int): maximum number of concurrent requests of all the tokens together
+        max_tasks_per_token (int) : maximum number of tasks of a single token running at the same time
+        idle_timeout (int)        : number of seconds after which a client without work is closed and dropped
+        pool_maxsize (int)        : maximum number of connections kept per host by the shared connection pool
+        api_kwargs (dict)         : other keyword arguments of every `API` client (i.e. prefetch). A cache or
+                                       a store must not be shared between tokens.
+
+    usage:
+        pool = ClientPool(workers=32, global_rate=100)
+        tasks = [pool.submit(token, lambda tsclient: tsclient.list_users()) for token in tokens]
+        users = [task.get() for task in tasks]
+        pool.close()
+    """
+
+    def __init__(self, workers=16, rate=5.0, burst=10, max_in_flight=4, global_rate=None, global_burst=None,
+                 global_max_in_flight=64, max_tasks_per_token=2, idle_timeout=300, pool_maxsize=None,
+                 api_kwargs=None):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.max_tasks_per_token = max_tasks_per_token
+        self.idle_timeout = idle_timeout
+        self.api_kwargs = dict(api_kwargs or {})
+        self._scheduler = RequestScheduler(rate=global_rate, burst=max(1, global_burst or global_rate or 0),
+                                           max_in_flight=global_max_in_flight)
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize or global_max_in_flight)
+        self._tenants = {}
+        # tokens with pending tasks, in round-robin order
+        self._ring = deque()
+        self._closed = False
+        self._last_eviction = time.time()
+        self._cond = threading.Condition()
+        self._workers = [threading.Thread(target=self._work, name="ClientPool-{}".format(i))
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.daemon = True
+            worker.start()
+
+    def __len__(self):
+        return len(self._tenants)
+
+    def _new_client(self, token):
+        scheduler = RequestScheduler(rate=self.rate, burst=self.burst, max_in_flight=self.max_in_flight,
+                                     parent=self._scheduler)
+        return API(token, scheduler=scheduler, http_adapter=self._adapter, **self.api_kwargs)
+
+    def _tenant(self, token):
+        """
+        returns the tenant of a token, creating it if needed. Must be called with the lock held.
+        """
+        tenant = self._tenants.get(token)
+        if tenant is None:
+            tenant = self._tenants[token] = _Tenant(self._new_client(token))
+        return tenant
+
+    def client(self, token):
+        """
+        returns the client of a token, creating it if needed. The client is shared with the tasks of the token,
+        and is closed once it is evicted: prefer `submit` for anything but short-lived uses.
+        """
+        with self._cond:
+            self._evict_idle()
+            tenant = self._tenant(token)
+            tenant.last_used = time.time()
+            return tenant.client
+
+    def submit(self, token, fn, *args, **kwargs):
+        """
+        queues the call `fn(client, *args, **kwargs)`, `client` being the API client of `token`
+
+        returns:
+            Task : the pending result of the call
+        """
+        task = Task(token, fn, args, kwargs)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("the client pool is closed")
+            self._evict_idle()
+            tenant = self._tenant(token)
+            if not tenant.tasks:
+                self._ring.append(token)
+            tenant.tasks.append(task)
+            self._cond.notify()
+        return task
+
+    def map(self, fn, tokens):
+        """
+        calls `fn(client)` for every token and returns the results, indexed by token
+
+        raises:
+            the first exception raised by a call
+        """
+        tasks = [(token, self.submit(token, fn)) for token in tokens]
+        return dict((token, task.get()) for token, task in tasks)
+
+    def _next_task(self):
+        """
+        returns the next runnable task in round-robin order, or None. Must be called with the lock held.
+        """
+        for _ in range(len(self._ring)):
+            token = self._ring.popleft()
+            tenant = self._tenants[token]
+            if tenant.running >= self.max_tasks_per_token:
+                self._ring.append(token)
+                continue
+            task = tenant.tasks.popleft()
+            tenant.running += 1
+            if tenant.tasks:
+                self._ring.append(token)
+            return task
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    if self._closed and not self._ring:
+                        return
+                    self._cond.wait(1.0)
+                    self._evict_idle()
+                    task = self._next_task()
+                tenant = self._tenants[task.token]
+            task._run(tenant.client)
+            with self._cond:
+                tenant.running -= 1
+                tenant.last_used = time.time()
+                self._cond.notify_all()
+
+    def _evict_idle(self):
+        """
+        closes and drops the clients without work for `idle_timeout` seconds. Must be called with the lock held.
+        """
+        now = time.time()
+        if now - self._last_eviction < min(self.idle_timeout, 60) / 10.0:
+            return
+        self._last_eviction = now
+        for token, tenant in list(self._tenants.items()):
+            if not tenant.tasks and not tenant.running and now - tenant.last_used > self.idle_timeout:
+                del self._tenants[token]
+                tenant.client.close()
+
+    def close(self):
+        """
+        stops the workers once the queued tasks are done, and closes every client and the connection pool
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+        with self._cond:
+            for tenant in self._tenants.values():
+                tenant.client.close()
+            self._tenants = {}
+        self._adapter.close()
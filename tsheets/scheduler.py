@@ -0,0 +1,164 @@
+import random
+import threading
+import time
+from email.utils import parsedate_tz, mktime_tz
+
+import requests
+
+
+class TokenBucket(object):
+    """
+    A thread-safe token bucket allowing `rate` requests per second with bursts of up to `burst` requests. A burst
+    below 1 is raised to 1, the bucket never holding a whole token otherwise.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds):
+        """
+        stops handing out tokens for `seconds` seconds (i.e. when the service asks to retry later)
+        """
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.time() + seconds)
+            self._tokens = 0.0
+
+    def acquire(self):
+        """
+        blocks until a token is available and takes it
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                if now >= self._resume_at:
+                    elapsed = now - max(self._updated, self._resume_at)
+                    self._tokens = min(self.burst, self._tokens + max(elapsed, 0.0) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1.0:
+                        self._tokens -= 1.0
+                        return
+                    wait = (1.0 - self._tokens) / self.rate
+                else:
+                    wait = self._resume_at - now
+            time.sleep(wait)
+
+
+class RequestScheduler(object):
+    """
+    Sends the HTTP requests of an `API` client: requests are paced by a token bucket, the number of requests in
+    flight is capped, and throttled (429), failed (5xx) or interrupted (connection error, timeout) requests are
+    retried with jittered exponential backoff, honoring the `Retry-After` header. A single scheduler is shared by
+    every thread using the same client.
+
+    args:
+        rate (float)        : requests per second. None disables the token bucket.
+        burst (int)         : maximum number of requests sent back to back
+        max_in_flight (int) : maximum number of concurrent requests
+        max_retries (int)   : number of times a request is retried before giving up
+        backoff (float)     : base delay, in seconds, of the exponential backoff
+        max_backoff (float) : maximum delay, in seconds, between two attempts
+        parent (RequestScheduler) : optional scheduler whose rate and concurrency limits also apply to every
+                                       request of this one, i.e. a limit shared by the clients of many tokens
+                                       (see `pool.ClientPool`)
+    """
+
+    retry_statuses = frozenset([429, 500, 502, 503, 504])
+
+    def __init__(self, rate=5.0, burst=10, max_in_flight=8, max_retries=5, backoff=0.5, max_backoff=60.0,
+                 parent=None):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retries = 0
+        self._retries_lock = threading.Lock()
+        self._local = threading.local()
+        self._bucket = TokenBucket(rate, burst) if rate else None
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.parent = parent
+        # the limits every request goes through, in acquisition order
+        self._buckets = [b for b in (self._bucket, parent and parent._bucket) if b is not None]
+        self._slots = [self._in_flight] + ([parent._in_flight] if parent is not None else [])
+
+    def _backoff_delay(self, attempt):
+        """
+        returns the 'full jitter' delay of the given retry attempt
+        """
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    @staticmethod
+    def _retry_after(response):
+        """
+        returns the delay, in seconds, requested by the `Retry-After` header of `response`, if any
+        """
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            date = parsedate_tz(value)
+            if date is None:
+                return None
+            return max(mktime_tz(date) - time.time(), 0.0)
+
+    def request(self, send, *args, **kwargs):
+        """
+        calls `send(*args, **kwargs)` (i.e. `session.get`) under the rate limit and retries it as needed
+
+        returns:
+            the last response received
+
+        raises:
+            requests.ConnectionError
+            requests.Timeout
+        """
+        return self._request(send, args, kwargs, self.retry_statuses, True)
+
+    def request_non_idempotent(self, send, *args, **kwargs):
+        """
+        same as `request`, for requests which must not be sent twice (i.e. `session.post`): they are only retried
+        when throttled (429), since the service did not process them.
+        """
+        return self._request(send, args, kwargs, frozenset([429]), False)
+
+    def last_retries(self):
+        """
+        returns the number of times the last request sent by the calling thread was retried
+        """
+        return getattr(self._local, 'retries', 0)
+
+    def _request(self, send, args, kwargs, retry_statuses, retry_errors):
+        attempt = 0
+        self._local.retries = 0
+        while True:
+            for bucket in self._buckets:
+                bucket.acquire()
+            for slot in self._slots:
+                slot.acquire()
+            try:
+                response = send(*args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if not retry_errors or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+            else:
+                if response.status_code not in retry_statuses or attempt >= self.max_retries:
+                    return response
+                retry_after = self._retry_after(response)
+                delay = self._backoff_delay(attempt) if retry_after is None else retry_after
+                if response.status_code == 429 and self._bucket is not None:
+                    # hold back every thread, not only this one
+                    self._bucket.pause(delay)
+            finally:
+                for slot in reversed(self._slots):
+                    slot.release()
+            attempt += 1
+            self._local.retries = attempt
+            with self._retries_lock:
+                self.retries += 1
+            time.sleep(delay)
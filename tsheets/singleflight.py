@@ -0,0 +1,63 @@
+import threading
+
+
+class _Call(object):
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces identical concurrent calls: while a call for a key is in flight, other callers with the same key
+    wait for it and share its result (or its exception) instead of making the call again.
+
+    usage:
+        flights = SingleFlight()
+        result, shared = flights.do(key, fetch, url)
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._calls)
+
+    def do(self, key, fn, *args):
+        """
+        calls `fn(*args)`, unless a call with the same key is already in flight, in which case its outcome is
+        waited for
+
+        returns:
+            (result, shared) : the result of the call, and whether it was shared with another caller's call
+
+        raises:
+            the exception raised by the call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args)
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
@@ -0,0 +1,261 @@
+import datetime
+import json
+import sqlite3
+import threading
+from .models import (User,
+                     Timesheet,
+                     Jobcode,
+                     JobcodeAssignment)
+
+
+ISO8601_FORMAT = '%Y-%m-%dT%H:%M:%S+00:00'
+
+
+class SyncStore(object):
+    """
+    A local SQLite copy of the users, jobcodes, jobcode assignments and timesheets of a company, kept current
+    with the `modified_since` filter of each endpoint.
+
+    Every endpoint has its own high-water mark: the (UTC) time at which its last successful sync started,
+    which is sent as `modified_since` on the next sync. Users, jobcodes and jobcode assignments are synced with
+    `active=both` so that archived records are updated and deleted assignments (`active` false) are removed.
+    Timesheets are synced with `on_the_clock=both`.
+
+    Note: timesheets deleted on TSheets are not reported by the timesheets endpoint and stay in the store.
+
+    args:
+        api (API)   : the client used to sync the store
+        path (str)  : path of the SQLite database. Default is an in-memory database.
+        since (str) : (ISO8601 format). modified_since value used for the first sync of each endpoint.
+        overlap (int) : number of seconds subtracted from each high-water mark to absorb clock skew.
+
+    usage:
+        store = SyncStore(tsclient, "tsheets.db")
+        tsclient.store = store
+        store.sync()
+        timesheets = store.timesheets(user_ids="1,2", start_date="2014-09-01", end_date="2014-09-30")
+    """
+
+    # sync parameters of every endpoint
+    _sync_params = (
+        (User, {'active': 'both'}),
+        (Jobcode, {'active': 'both', 'parent_ids': -1, 'type': 'all'}),
+        (JobcodeAssignment, {'active': 'both', 'type': 'all'}),
+        (Timesheet, {'on_the_clock': 'both'}),
+    )
+
+    # filters `SyncStore.timesheets` can answer locally
+    timesheet_filters = frozenset(['user_ids', 'start_date', 'end_date', 'on_the_clock'])
+
+    def __init__(self, api, path=":memory:", since="2000-01-01T00:00:00+00:00", overlap=60):
+        self.api = api
+        self.since = since
+        self.overlap = overlap
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS records (
+                endpoint TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                user_id INTEGER,
+                jobcode_id INTEGER,
+                date TEXT,
+                active INTEGER,
+                data TEXT NOT NULL,
+                PRIMARY KEY (endpoint, id)
+            );
+            CREATE INDEX IF NOT EXISTS records_user_date ON records (endpoint, user_id, date);
+            CREATE TABLE IF NOT EXISTS sync_state (
+                endpoint TEXT PRIMARY KEY,
+                high_water TEXT NOT NULL
+            );
+        """)
+
+    def high_water(self, model):
+        """
+        returns the modified_since value of the next sync of `model`
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT high_water FROM sync_state WHERE endpoint = ?",
+                                           (model._endpoint_name,)).fetchone()
+        return row[0] if row else self.since
+
+    def sync(self, *models):
+        """
+        pulls every record modified since the last sync of each model in `models` (default is every endpoint)
+        and returns the number of records received.
+
+        raises:
+            TSheetsError
+            HTTPException
+        """
+        models = models or [model for model, _ in self._sync_params]
+        count = 0
+        for model, params in self._sync_params:
+            if model in models:
+                count += self._sync_model(model, params)
+        return count
+
+    def _sync_model(self, model, params):
+        started = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.overlap)
+        count = 0
+        with self._lock:
+            modified_since = self.high_water(model)
+            try:
+                for page_json in self.api._iter_pages(model, modified_since=modified_since, **params):
+                    rows = list(self.api._result_rows(model, page_json))
+                    self._save_rows(model, rows)
+                    count += len(rows)
+                self._connection.execute("INSERT OR REPLACE INTO sync_state (endpoint, high_water) VALUES (?, ?)",
+                                         (model._endpoint_name, started.strftime(ISO8601_FORMAT)))
+                self._connection.commit()
+            except Exception:
+                self._connection.rollback()
+                raise
+        return count
+
+    def _save_rows(self, model, rows):
+        endpoint = model._endpoint_name
+        deleted = []
+        saved = []
+        for row in rows:
+            if model is JobcodeAssignment and row.get('active') is False:
+                deleted.append((endpoint, row['id']))
+                continue
+            active = row.get('active')
+            saved.append((endpoint, row['id'], row.get('user_id'), row.get('jobcode_id'), row.get('date'),
+                          None if active is None else int(active), json.dumps(row)))
+        self._connection.executemany("DELETE FROM records WHERE endpoint = ? AND id = ?", deleted)
+        self._connection.executemany("INSERT OR REPLACE INTO records "
+                                     "(endpoint, id, user_id, jobcode_id, date, active, data) "
+                                     "VALUES (?, ?, ?, ?, ?, ?, ?)", saved)
+
+    @staticmethod
+    def _ids(ids):
+        if ids is None:
+            return None
+        if isinstance(ids, (list, tuple, set)):
+            return [int(i) for i in ids]
+        return [int(i) for i in str(ids).split(",") if i.strip()]
+
+    def _rows(self, model, where=(), args=()):
+        """
+        returns the raw rows (dicts) of `model` matching the SQL conditions in `where`
+        """
+        sql = "SELECT data FROM records WHERE endpoint = ?"
+        for condition in where:
+            sql += " AND " + condition
+        sql += " ORDER BY id"
+        with self._lock:
+            cursor = self._connection.execute(sql, (model._endpoint_name,) + tuple(args))
+            return [json.loads(data) for (data,) in cursor.fetchall()]
+
+    @staticmethod
+    def _in(column, ids):
+        return "{} IN ({})".format(column, ",".join("?" * len(ids)))
+
+    @staticmethod
+    def _active(column, active):
+        """
+        returns the SQL condition for an 'yes', 'no' or 'both' `active` filter
+        """
+        return {'yes': [column + " = 1"], 'no': [column + " = 0"]}.get(active, [])
+
+    def user_rows(self, ids=None, active='both'):
+        where, args = self._active("active", active), []
+        ids = self._ids(ids)
+        if ids is not None:
+            where.append(self._in("id", ids))
+            args.extend(ids)
+        return self._rows(User, where, args)
+
+    def users(self, ids=None, active='yes'):
+        """
+        returns the stored users, as User objects
+        """
+        return [User(api=self.api, **u) for u in self.user_rows(ids, active)]
+
+    def jobcodes(self, ids=None, active='yes'):
+        """
+        returns the stored jobcodes, as Jobcode objects
+        """
+        where, args = self._active("active", active), []
+        ids = self._ids(ids)
+        if ids is not None:
+            where.append(self._in("id", ids))
+            args.extend(ids)
+        return [Jobcode(api=self.api, **j) for j in self._rows(Jobcode, where, args)]
+
+    def jobcode_assignments(self, user_ids=None):
+        """
+        returns the stored (active) jobcode assignments, as JobcodeAssignment objects
+        """
+        where, args = [], []
+        user_ids = self._ids(user_ids)
+        if user_ids is not None:
+            where.append(self._in("user_id", user_ids))
+            args.extend(user_ids)
+        return [JobcodeAssignment(api=self.api, **a) for a in self._rows(JobcodeAssignment, where, args)]
+
+    def timesheet_rows(self, user_ids=None, start_date=None, end_date=None, on_the_clock='no'):
+        where, args = [], []
+        user_ids = self._ids(user_ids)
+        if user_ids is not None:
+            where.append(self._in("user_id", user_ids))
+            args.extend(user_ids)
+        if start_date:
+            where.append("date >= ?")
+            args.append(start_date)
+        if end_date:
+            where.append("date <= ?")
+            args.append(end_date)
+        rows = self._rows(Timesheet, where, args)
+        if on_the_clock in ('yes', 'no'):
+            rows = [ts for ts in rows if bool(ts.get('on_the_clock')) == (on_the_clock == 'yes')]
+        return rows
+
+    def timesheets(self, user_ids=None, start_date=None, end_date=None, on_the_clock='no'):
+        """
+        returns the stored timesheets matching the filters, as Timesheet objects
+
+        args:
+            see: `API.list_timesheets` method
+        """
+        return [Timesheet(api=self.api, **ts)
+                for ts in self.timesheet_rows(user_ids, start_date, end_date, on_the_clock)]
+
+    def list_jobcodes_by_user(self, user_ids, exclude_global=True):
+        """
+        answers `API.list_jobcodes_by_user` (for active jobcode assignments) from the store,
+        returning the same data structure
+        """
+        user_ids = self._ids(user_ids)
+        assignments = self._rows(JobcodeAssignment, [self._in("user_id", user_ids)], user_ids)
+        if not assignments:
+            return None
+
+        user_jobcode_ids = {}
+        for assignment in assignments:
+            user_jobcode_ids.setdefault(assignment["user_id"], []).append(assignment["jobcode_id"])
+
+        jobcode_ids = list(set(a["jobcode_id"] for a in assignments))
+        jobcode_index = {}
+        for j in self._rows(Jobcode, [self._in("id", jobcode_ids)], jobcode_ids):
+            if j['has_children'] or (exclude_global and not j.get('assigned_to_all')):
+                continue
+            jobcode_index[j["id"]] = self.api._hydrate(Jobcode, j)
+
+        result = {}
+        for u in self.user_rows(user_jobcode_ids.keys()):
+            user_jobcodes = []
+            seen = set()
+            for jobcode_id in user_jobcode_ids[u["id"]]:
+                if jobcode_id in jobcode_index and jobcode_id not in seen:
+                    seen.add(jobcode_id)
+                    user_jobcodes.append(jobcode_index[jobcode_id])
+            result[u["id"]] = {"user": self.api._hydrate(User, u), "jobcodes": user_jobcodes}
+        return result
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,226 @@
+import datetime
+import threading
+from .models import Jobcode
+from .store import ISO8601_FORMAT
+
+
+class JobcodeTree(object):
+    """
+    The whole jobcode hierarchy of a company, held in memory with indexes answering tree queries without
+    re-querying the API:
+        get, parent, children, depth, is_ancestor and is_leaf : O(1)
+        ancestors and path                                      : O(depth)
+        descendants and leaves                                  : O(size of the subtree)
+
+    The tree is loaded either in one paginated walk (`parent_ids=-1`) or level by level ('bfs'), each level's
+    requests being issued concurrently in the client's thread pool. `refresh` only pulls the jobcodes modified
+    since the last load. Jobcodes are shared through the client's identity map.
+
+    args:
+        api (API)    : the client used to load the tree
+        type (str)   : regular, pto, or all. Default is all.
+        active (str) : 'yes', 'no', or 'both'. Default is 'both', so that archived jobcodes stay in the tree.
+        overlap (int): number of seconds subtracted from the refresh high-water mark to absorb clock skew.
+    """
+
+    # maximum number of parent ids sent in a single request of a 'bfs' load
+    parent_ids_per_request = 50
+
+    def __init__(self, api, type='all', active='both', overlap=60):
+        self.api = api
+        self.type = type
+        self.active = active
+        self.overlap = overlap
+        self.high_water = None
+        self._jobcodes = {}
+        self._children = {}
+        self._depth = {}
+        self._order = []
+        self._tin = {}
+        self._tout = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._jobcodes)
+
+    def __contains__(self, jobcode_id):
+        return jobcode_id in self._jobcodes
+
+    def _params(self, **kwargs):
+        kwargs.update({'type': self.type, 'active': self.active})
+        return kwargs
+
+    def _fetch(self, **kwargs):
+        """
+        returns the raw rows of every page of a jobcodes query
+        """
+        rows = []
+        for page_json in self.api._iter_pages(Jobcode, prefetch=0, **kwargs):
+            rows.extend(self.api._result_rows(Jobcode, page_json))
+        return rows
+
+    def load(self, strategy='flat'):
+        """
+        loads the whole hierarchy, replacing the current one
+
+        args:
+            strategy (str) : 'flat' walks the pages of a single `parent_ids=-1` query, 'bfs' fetches the tree
+                                level by level, the requests of each level being issued concurrently.
+
+        raises:
+            TSheetsError
+            HTTPException
+        """
+        started = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.overlap)
+        if strategy == 'bfs':
+            rows = self._load_bfs()
+        else:
+            rows = self._fetch(**self._params(parent_ids=-1))
+        with self._lock:
+            self._jobcodes = dict((row['id'], self.api._hydrate(Jobcode, row)) for row in rows)
+            self.high_water = started.strftime(ISO8601_FORMAT)
+            self._build_indexes()
+        return self
+
+    def _load_bfs(self):
+        pool = self.api._get_pool()
+        rows = []
+        parent_ids = [0]
+        while parent_ids:
+            chunks = [parent_ids[i:i + self.parent_ids_per_request]
+                      for i in range(0, len(parent_ids), self.parent_ids_per_request)]
+            pending = [pool.apply_async(self._fetch, (), self._params(parent_ids=",".join(str(p) for p in chunk)))
+                       for chunk in chunks]
+            level = []
+            for async_result in pending:
+                level.extend(async_result.get())
+            rows.extend(level)
+            parent_ids = [row['id'] for row in level if row.get('has_children')]
+        return rows
+
+    def refresh(self):
+        """
+        pulls the jobcodes modified since the last load or refresh and updates the indexes.
+        Loads the whole tree when it has not been loaded yet.
+
+        raises:
+            TSheetsError
+            HTTPException
+        """
+        if self.high_water is None:
+            return self.load()
+        started = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.overlap)
+        rows = self._fetch(**self._params(parent_ids=-1, modified_since=self.high_water))
+        with self._lock:
+            for row in rows:
+                self._jobcodes[row['id']] = self.api._hydrate(Jobcode, row)
+            self.high_water = started.strftime(ISO8601_FORMAT)
+            if rows:
+                self._build_indexes()
+        return self
+
+    def _build_indexes(self):
+        """
+        builds the children, depth and pre-order (entry/exit position) indexes of the tree
+        """
+        children = {0: []}
+        for jobcode in self._jobcodes.itervalues():
+            parent_id = jobcode.parent_id if jobcode.parent_id in self._jobcodes else 0
+            children.setdefault(parent_id, []).append(jobcode.id)
+        for ids in children.itervalues():
+            ids.sort(key=lambda i: (self._jobcodes[i].name, i))
+
+        depth = {}
+        order = []
+        tin = {}
+        tout = {}
+        # iterative depth-first walk; a jobcode's descendants are order[tin[id] + 1:tout[id]]
+        stack = [(jobcode_id, 0, False) for jobcode_id in reversed(children[0])]
+        while stack:
+            jobcode_id, level, done = stack.pop()
+            if done:
+                tout[jobcode_id] = len(order)
+                continue
+            depth[jobcode_id] = level
+            tin[jobcode_id] = len(order)
+            order.append(jobcode_id)
+            stack.append((jobcode_id, level, True))
+            for child_id in reversed(children.get(jobcode_id, [])):
+                stack.append((child_id, level + 1, False))
+
+        self._children = children
+        self._depth = depth
+        self._order = order
+        self._tin = tin
+        self._tout = tout
+
+    def get(self, jobcode_id):
+        """
+        returns the Jobcode with the given id, or None
+        """
+        return self._jobcodes.get(jobcode_id)
+
+    def parent(self, jobcode_id):
+        """
+        returns the parent Jobcode of a jobcode, or None for top-level jobcodes
+        """
+        return self._jobcodes.get(self._jobcodes[jobcode_id].parent_id)
+
+    def children(self, jobcode_id=0):
+        """
+        returns the child Jobcodes of a jobcode (the top-level jobcodes for 0)
+        """
+        return [self._jobcodes[i] for i in self._children.get(jobcode_id, [])]
+
+    def depth(self, jobcode_id):
+        """
+        returns the depth of a jobcode, 0 being the top level
+        """
+        return self._depth[jobcode_id]
+
+    def is_leaf(self, jobcode_id):
+        return not self._children.get(jobcode_id)
+
+    def is_ancestor(self, ancestor_id, jobcode_id):
+        """
+        returns True if `ancestor_id` is a (strict) ancestor of `jobcode_id`
+        """
+        if ancestor_id not in self._tin or jobcode_id not in self._tin:
+            return False
+        return self._tin[ancestor_id] < self._tin[jobcode_id] < self._tout[ancestor_id]
+
+    def ancestors(self, jobcode_id):
+        """
+        returns the ancestors of a jobcode, from its parent up to its top-level jobcode
+        """
+        result = []
+        jobcode = self.parent(jobcode_id)
+        while jobcode is not None:
+            result.append(jobcode)
+            jobcode = self._jobcodes.get(jobcode.parent_id)
+        return result
+
+    def path(self, jobcode_id):
+        """
+        returns the jobcodes from the top level down to `jobcode_id` (included)
+        """
+        result = self.ancestors(jobcode_id)
+        result.reverse()
+        result.append(self._jobcodes[jobcode_id])
+        return result
+
+    def descendants(self, jobcode_id):
+        """
+        returns every jobcode underneath a jobcode, in depth-first order
+        """
+        return [self._jobcodes[i] for i in self._order[self._tin[jobcode_id] + 1:self._tout[jobcode_id]]]
+
+    def leaves(self, jobcode_id=None):
+        """
+        returns the jobcodes without children, underneath `jobcode_id` or in the whole tree
+        """
+        if jobcode_id is None:
+            ids = self._order
+        else:
+            ids = self._order[self._tin[jobcode_id]:self._tout[jobcode_id]]
+        return [self._jobcodes[i] for i in ids if not self._children.get(i)]